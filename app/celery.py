@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
@@ -15,6 +16,24 @@ app.conf.beat_schedule = {
     },
     "clean-old-pending-bookings": {
         "task": "booking.tasks.clean_old_pending_bookings",
-        "schedule": crontab(hour=0, minute=0),
+        # истёкшая блокировка не должна держать слот до полуночи
+        "schedule": crontab(),  # каждую минуту
     },
 }
+
+
+@worker_process_init.connect
+def build_notification_templates(**kwargs):
+    # таблица шаблонов собирается в каждом дочернем процессе до первой задачи,
+    # а не на первом уведомлении
+    from notifications.services.renderer import build_table
+
+    build_table()
+
+
+@worker_process_shutdown.connect
+def close_smtp_connection(**kwargs):
+    # SMTP-соединение живёт весь процесс воркера — закрываем вежливо (QUIT)
+    from notifications.services.email_service import close_connection
+
+    close_connection()
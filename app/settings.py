@@ -148,10 +148,27 @@ EMAIL_PORT = env.int("EMAIL_PORT", default=587)
 EMAIL_HOST_USER = env("EMAIL_HOST_USER", default=None)
 EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD", default=None)
 EMAIL_USE_TLS = env.bool("EMAIL_USE_TLS", default=True)
+EMAIL_TIMEOUT = env.int("EMAIL_TIMEOUT", default=10)  # сек: зависшее соединение не должно держать воркер
 DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL", default="webmaster@localhost")
+# писем в секунду на процесс воркера, 0 — без ограничения
+EMAIL_RATE_PER_SECOND = env.float("EMAIL_RATE_PER_SECOND", default=0)
 
 TELEGRAM_BOT_TOKEN = env("TELEGRAM_BOT_TOKEN", default=None)
 TELEGRAM_CHAT_ID = env("TELEGRAM_CHAT_ID", default=None)
+TELEGRAM_API_URL = env("TELEGRAM_API_URL", default="https://api.telegram.org")
+# сообщений в секунду на процесс воркера: Telegram не пропускает больше ~1/с в один чат
+TELEGRAM_RATE_PER_SECOND = env.float("TELEGRAM_RATE_PER_SECOND", default=1.0)
+# >0 — уведомления мастеру копятся столько секунд и уходят одним сообщением
+TELEGRAM_DIGEST_SECONDS = env.int("TELEGRAM_DIGEST_SECONDS", default=0)
+
+# языки уведомлений: таблица шаблонов для них собирается при старте воркера.
+# Версия шаблона на языке лежит в подпапке (email/en/booking_confirmed.html);
+# если её нет, берётся следующий язык цепочки, в конце — шаблон без языка.
+NOTIFICATION_LANGUAGES = env.list("NOTIFICATION_LANGUAGES", default=["no", "en"])
+NOTIFICATION_LANGUAGE_FALLBACKS = {
+    "nb": ["no"],
+    "nn": ["no"],
+}
 
 
 REDIS_URL = env("REDIS_URL", default=None)
@@ -162,6 +179,13 @@ if REDIS_URL:
             "LOCATION": REDIS_URL,
         }
     }
+else:
+    # кеш в памяти процесса: инвалидация видна только в нём, остальное добивает TTL
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
     
     
 CELERY_BROKER_URL = env("CELERY_BROKER_URL", default="redis://localhost:6379/1")
@@ -175,8 +199,38 @@ CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 60 * 10  # 10 minutes
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Очереди: у каждой свой воркер (docker-compose.yml), поэтому шторм ретраев SMTP
+# не задерживает обслуживание, а ночное планирование — живые уведомления.
+#   notify-realtime  — отправка уведомлений «сейчас»;
+#   notify-scheduled — ETA-задачи (напоминания) и отложенные ретраи отправки;
+#   maintenance      — beat-задачи обслуживания.
+QUEUE_NOTIFY_REALTIME = "notify-realtime"
+QUEUE_NOTIFY_SCHEDULED = "notify-scheduled"
+QUEUE_MAINTENANCE = "maintenance"
+
+CELERY_TASK_DEFAULT_QUEUE = QUEUE_MAINTENANCE
+CELERY_TASK_ROUTES = {
+    "notifications.tasks.send_outbox_event": {"queue": QUEUE_NOTIFY_REALTIME},
+    "notifications.tasks.flush_master_digest": {"queue": QUEUE_NOTIFY_REALTIME},
+    "notifications.tasks.register_outbox_event": {"queue": QUEUE_NOTIFY_SCHEDULED},
+    "notifications.tasks.schedule_outbox_event": {"queue": QUEUE_MAINTENANCE},
+    "booking.tasks.clean_old_pending_bookings": {"queue": QUEUE_MAINTENANCE},
+}
+# воркер берёт задачу, только когда свободен: с acks_late длинная отправка
+# не держит за собой очередь уже полученных сообщений
+CELERY_WORKER_PREFETCH_MULTIPLIER = env.int("CELERY_WORKER_PREFETCH_MULTIPLIER", default=1)
+
 
 WORK_START=env.int("WORK_START", default=10)
 WORK_END=env.int("WORK_END", default=20)
 GRID_STEP=env.int("GRID_STEP", default=10)
-LOCK_TIMEOUT=env.int("LOCK_TIMEOUT", default=5)
\ No newline at end of file
+LOCK_TIMEOUT=env.int("LOCK_TIMEOUT", default=5)
+
+
+# уведомления шлёт опрос outbox (manage.py relay_outbox), а не ETA-задачи Celery
+OUTBOX_RELAY = env.bool("OUTBOX_RELAY", default=False)
+OUTBOX_RELAY_BATCH_SIZE = env.int("OUTBOX_RELAY_BATCH_SIZE", default=100)
+OUTBOX_RELAY_INTERVAL = env.float("OUTBOX_RELAY_INTERVAL", default=1.0)  # сек, пауза, когда очередь пуста
+OUTBOX_RELAY_RETRY_DELAY = env.int("OUTBOX_RELAY_RETRY_DELAY", default=60)  # сек до первого повтора, дальше x2
+OUTBOX_RELAY_MAX_ATTEMPTS = env.int("OUTBOX_RELAY_MAX_ATTEMPTS", default=8)  # потом событие снимается с очереди
+OUTBOX_LEASE_SECONDS = env.int("OUTBOX_LEASE_SECONDS", default=120)  # сек на отправку одного события или пачки
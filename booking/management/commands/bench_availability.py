@@ -0,0 +1,147 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from booking.models import Booking
+from booking.services import availability_cache
+from booking.services.scheduler import WORK_START
+from services.models import Service, ServiceCategory
+
+
+class Command(BaseCommand):
+    help = "Сравнить пропускную способность sync- и async-эндпоинтов доступности на одних и тех же данных."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300, help="запросов на режим")
+        parser.add_argument("--concurrency", type=int, default=16, help="одновременных клиентов")
+        parser.add_argument("--bookings", type=int, default=400, help="броней в фикстуре")
+        parser.add_argument(
+            "--warm",
+            action="store_true",
+            help="не сбрасывать кеш доступности дат запроса перед каждым запросом",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="запустить при DEBUG=False: фикстура на время замера занимает реальные слоты",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError(
+                "Бенчмарк пишет брони в настроенную БД — на рабочей базе запускайте только с --force."
+            )
+
+        category = ServiceCategory.objects.create(name=f"bench-{time.time_ns()}")
+        service = Service.objects.create(
+            category=category, name=category.name, price=0, duration_min=45, buffer_after_min=10
+        )
+        try:
+            self._seed(service, options["bookings"])
+            paths = self._paths(service, options["requests"])
+            window = sorted({d for _, days in paths["sync"] for d in days})
+
+            # тестовые клиенты ходят с Host: testserver
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                if not options["warm"]:
+                    self._check_cold(*paths["sync"][0])
+                for mode, run in (("sync", self._run_sync), ("async", self._run_async)):
+                    # кеш записей ключуется версиями дат: каждый режим начинает с пустого
+                    availability_cache.invalidate_days(window)
+                    started = time.perf_counter()
+                    run(paths[mode], options["concurrency"], options["warm"])
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{mode:>5}: {len(paths[mode])} requests in {elapsed:.2f}s "
+                        f"= {len(paths[mode]) / elapsed:.1f} req/s"
+                    )
+        finally:
+            # удаление броней сбрасывает версии затронутых дат через сигналы,
+            # остальной кеш (сессии, другие услуги) не трогаем
+            Booking.objects.filter(service=service).delete()
+            availability_cache.invalidate_service(service.pk)
+            service.delete()
+            category.delete()
+
+    def _seed(self, service: Service, count: int) -> None:
+        today = timezone.localdate()
+        work_start = timezone.make_aware(datetime.combine(today, WORK_START))
+        Booking.objects.bulk_create(
+            Booking(
+                customer_name="bench",
+                customer_phone="0",
+                service=service,
+                starts_at=work_start + timedelta(days=1 + i // 8, minutes=60 * (i % 8) + 7),
+                status=Booking.Status.COMPLETED,
+            )
+            for i in range(count)
+        )
+
+    def _paths(self, service: Service, total: int) -> Dict[str, List[Tuple[str, List[date]]]]:
+        """Запросы по режимам: путь и даты, чей кеш он читает."""
+        today = timezone.localdate()
+        window = availability_cache.date_range(today, today + timedelta(days=59))
+        paths: Dict[str, List[Tuple[str, List[date]]]] = {"sync": [], "async": []}
+        for i in range(total):
+            day = today + timedelta(days=1 + i % 60)
+            for mode, suffix in (("sync", ""), ("async", "-async")):
+                if i % 4 == 0:
+                    url = reverse(f"booking:available-days{suffix}", args=[service.pk])
+                    paths[mode].append((f"{url}?days_ahead=60", window))
+                else:
+                    url = reverse(f"booking:available-slots{suffix}", args=[service.pk])
+                    paths[mode].append((f"{url}?date={day.isoformat()}", [day]))
+        return paths
+
+    def _check_cold(self, path: str, days: List[date]) -> None:
+        # без этого «холодный» замер тихо мерил бы попадания в кеш
+        availability_cache.invalidate_days(days)
+        with CaptureQueriesContext(connection) as queries:
+            _check(Client().get(path), path)
+        if not queries:
+            raise CommandError(f"{path}: запрос после сброса кеша не обратился к БД")
+
+    def _run_sync(self, paths: List[Tuple[str, List[date]]], concurrency: int, warm: bool) -> None:
+        def worker(chunk: List[Tuple[str, List[date]]]) -> None:
+            client = Client()
+            try:
+                for path, days in chunk:
+                    if not warm:
+                        availability_cache.invalidate_days(days)
+                    _check(client.get(path), path)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, [paths[i::concurrency] for i in range(concurrency)]))
+
+    def _run_async(self, paths: List[Tuple[str, List[date]]], concurrency: int, warm: bool) -> None:
+        ainvalidate = sync_to_async(availability_cache.invalidate_days, thread_sensitive=False)
+
+        async def worker(chunk: List[Tuple[str, List[date]]]) -> None:
+            client = AsyncClient()
+            for path, days in chunk:
+                if not warm:
+                    await ainvalidate(days)
+                _check(await client.get(path), path)
+
+        async def main() -> None:
+            await asyncio.gather(*(worker(paths[i::concurrency]) for i in range(concurrency)))
+
+        asyncio.run(main())
+
+
+def _check(response, path: str) -> None:
+    if response.status_code != 200:
+        raise CommandError(f"{path}: HTTP {response.status_code}")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_remove_daysoff_daysoff_end_after_start_and_more'),
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'CANCELLED'), _negated=True), fields=['starts_at', 'status', 'created_at'], include=('ends_at', 'service'), name='booking_active_starts_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:36
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_lock_expires_at(apps, schema_editor):
+    Booking = apps.get_model('booking', 'Booking')
+    Booking.objects.filter(status='PENDING').update(
+        lock_expires_at=models.F('created_at') + timedelta(minutes=settings.LOCK_TIMEOUT)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_booking_active_starts_idx'),
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_active_starts_idx',
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='lock_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_lock_expires_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'CANCELLED'), _negated=True), fields=['starts_at', 'lock_expires_at'], include=('ends_at', 'service'), name='booking_active_starts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['lock_expires_at'], name='booking_pending_lock_idx'),
+        ),
+    ]
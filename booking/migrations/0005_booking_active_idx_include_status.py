@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_booking_lock_expires_at'),
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_active_starts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'CANCELLED'), _negated=True), fields=['starts_at', 'lock_expires_at'], include=('ends_at', 'service', 'status'), name='booking_active_starts_idx'),
+        ),
+    ]
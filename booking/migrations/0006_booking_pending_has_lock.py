@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:23
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_lock_expires_at(apps, schema_editor):
+    # PENDING, созданные мимо save() после 0004
+    Booking = apps.get_model('booking', 'Booking')
+    Booking.objects.filter(status='PENDING', lock_expires_at__isnull=True).update(
+        lock_expires_at=models.F('created_at') + timedelta(minutes=settings.LOCK_TIMEOUT)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_booking_active_idx_include_status'),
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_lock_expires_at, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('status', 'PENDING'), _negated=True), ('lock_expires_at__isnull', False), _connector='OR'), name='booking_pending_has_lock'),
+        ),
+    ]
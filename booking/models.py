@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from django.db.models import Q, F
@@ -47,6 +48,20 @@ class DaysOff(models.Model):
         return f"Выходные с: {self.start} По {self.end} - {self.reason if self.reason else 'Без причины'}"
     
 
+class BookingQuerySet(models.QuerySet):
+    def active(self, now=None):
+        """
+        Брони, которые занимают время: не отменённые, а PENDING — только пока не
+        истекла блокировка. Срок блокировки учитывается лишь у PENDING: у брони,
+        сменившей статус мимо save() (update(), правка в БД), он мог остаться.
+        У PENDING срок есть всегда — это держит ограничение booking_pending_has_lock.
+        """
+        now = now or timezone.now()
+        return self.exclude(status=Booking.Status.CANCELLED).filter(
+            ~Q(status=Booking.Status.PENDING) | Q(lock_expires_at__gt=now)
+        )
+
+
 class Booking(models.Model):
     class Status(models.TextChoices):
         PENDING    = "PENDING", "Pending"
@@ -76,6 +91,10 @@ class Booking(models.Model):
     )
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    # до какого момента PENDING-бронь держит слот; у остальных статусов пусто
+    lock_expires_at = models.DateTimeField(blank=True, null=True)
+
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
         ordering = ['-starts_at']
@@ -88,6 +107,28 @@ class Booking(models.Model):
                 fields=["starts_at"],
                 name="uniq_start_single_master",
             ),
+            # PENDING без срока блокировки не отличить от вечной: её не сочтёт занятой
+            # active() и не удалит очистка, а слот она держит (bulk_create, update())
+            models.CheckConstraint(
+                check=~Q(status="PENDING") | Q(lock_expires_at__isnull=False),
+                name="booking_pending_has_lock",
+            ),
+        ]
+        indexes = [
+            # активные брони: диапазон по starts_at + фильтр по сроку блокировки;
+            # ends_at, service и status в INCLUDE, чтобы планировщик читал только индекс
+            models.Index(
+                fields=["starts_at", "lock_expires_at"],
+                include=["ends_at", "service", "status"],
+                condition=~Q(status="CANCELLED"),
+                name="booking_active_starts_idx",
+            ),
+            # очистка истёкших блокировок
+            models.Index(
+                fields=["lock_expires_at"],
+                condition=Q(status="PENDING"),
+                name="booking_pending_lock_idx",
+            ),
         ]
         verbose_name = 'Бронирование'
         verbose_name_plural = 'Бронирования'
@@ -101,6 +142,20 @@ class Booking(models.Model):
             duration = getattr(self.service, "duration_min", None)
             if duration:
                 self.ends_at = self.starts_at + timedelta(minutes=duration)
+
+        if self.status == Booking.Status.PENDING:
+            if self.lock_expires_at is None:
+                self.lock_expires_at = (self.created_at or timezone.now()) + timedelta(
+                    minutes=settings.LOCK_TIMEOUT
+                )
+        else:
+            self.lock_expires_at = None
+
+        # смена статуса через update_fields (confirm() и т. п.) снимает блокировку
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "lock_expires_at"}
+
         super().save(*args, **kwargs)
 
     def confirm(self):
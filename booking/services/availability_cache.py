@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from services.models import Service
+
+
+# верхняя граница жизни записи; дни с PENDING-бронями живут до истечения
+# ближайшей блокировки (см. `store_many`)
+CACHE_TTL: int = settings.LOCK_TIMEOUT * 60  # сек
+# версии тоже истекают, чтобы ключи не копились; пропавшая версия читается как новая,
+# а жить ей не меньше CACHE_TTL — тогда и вернувшаяся пустая версия услуги даёт
+# ETag с другим номером интервала (см. `schedule_etag`)
+VERSION_TTL: int = max(CACHE_TTL, 24 * 60 * 60)  # сек
+
+_PREFIX = "availability"
+
+
+def _version_key(day: date) -> str:
+    return f"{_PREFIX}:version:{day.isoformat()}"
+
+
+def _service_version_key(service_id: int) -> str:
+    return f"{_PREFIX}:service-version:{service_id}"
+
+
+def _new_version() -> str:
+    return uuid4().hex[:12]
+
+
+def get_versions(days: Iterable[date]) -> Dict[date, str]:
+    """
+    Версии расписания по датам. Каждое изменение брони/перерыва/выходного
+    на дату выдаёт ей новую версию, и старые записи кеша просто перестают читаться.
+    """
+    keys = {_version_key(d): d for d in days}
+    return _fill_versions(keys, cache.get_many(keys))
+
+
+def _fill_versions(keys: Dict[str, date], found: Dict[str, str]) -> Dict[date, str]:
+    versions: Dict[date, str] = {}
+    for key, day in keys.items():
+        version = found.get(key)
+        if version is None:
+            # версии нет (первое обращение, истекла или вытеснена) — заводим новую,
+            # при гонке побеждает тот, кто записал первым
+            version = _new_version()
+            if not cache.add(key, version, timeout=VERSION_TTL):
+                version = cache.get(key) or version
+        versions[day] = version
+    return versions
+
+
+def schedule_etag(service_id: int, days: Iterable[date], grid_step: int, salt: str = "") -> str:
+    """
+    Сильный ETag ответа о доступности: меняется вместе с версиями дат окна и услуги.
+    Считается только по кешу, без запросов к БД. Номер интервала CACHE_TTL входит
+    в тег, потому что истёкшая PENDING-блокировка меняет ответ без записи в БД.
+    """
+    days = list(days)
+    keys = {_version_key(d): d for d in days}
+    service_key = _service_version_key(service_id)
+    found: Dict[str, str] = cache.get_many([service_key, *keys])
+    versions = _fill_versions(keys, found)
+
+    parts = [
+        str(service_id),
+        # версию услуги заводит только её изменение: запрос по любому id ключей не плодит
+        found.get(service_key, ""),
+        str(grid_step),
+        str(int(time.time() // CACHE_TTL)),
+        salt,
+        *(f"{d.isoformat()}={versions[d]}" for d in days),
+    ]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def invalidate_days(days: Iterable[date]) -> None:
+    """Сбросить кеш доступности на указанные даты для всех услуг."""
+    cache.set_many({_version_key(d): _new_version() for d in set(days)}, timeout=VERSION_TTL)
+
+
+def invalidate_service(service_id: int) -> None:
+    """Сменить версию услуги (длительность и т. п.) — меняет её ETag."""
+    cache.set(_service_version_key(service_id), _new_version(), timeout=VERSION_TTL)
+
+
+def lookup_many(
+    kind: str,
+    services: List[Service],
+    days: List[date],
+    grid_step: int,
+) -> Tuple[Dict[int, Dict[date, Any]], Dict[int, Dict[date, str]]]:
+    """
+    Прочитать записи кеша одного вида (`kind`) для набора услуг и дат одним запросом.
+    Вернуть {service_id: {дата: значение}} для найденных записей и ключи всех пар —
+    по ним потом сохраняются промахи.
+    """
+    versions = get_versions(days)
+    keys: Dict[int, Dict[date, str]] = {
+        s.pk: {
+            d: (
+                f"{_PREFIX}:{kind}:{s.pk}:{s.duration_min}:{grid_step}:"
+                f"{d.isoformat()}:{versions[d]}"
+            )
+            for d in days
+        }
+        for s in services
+    }
+    found = cache.get_many([k for by_day in keys.values() for k in by_day.values()])
+    hits: Dict[int, Dict[date, Any]] = {
+        pk: {d: found[k] for d, k in by_day.items() if k in found}
+        for pk, by_day in keys.items()
+    }
+    return hits, keys
+
+
+def store_many(
+    values: Dict[int, Dict[date, Any]],
+    keys: Dict[int, Dict[date, str]],
+    expires: Optional[Dict[date, Optional[datetime]]] = None,
+) -> None:
+    """
+    Сохранить посчитанные значения под ключами, полученными из `lookup_many`.
+    `expires` — когда ответ по дате устареет сам (истечение PENDING-блокировки);
+    запись живёт до этого момента, но не дольше CACHE_TTL.
+    """
+    now = timezone.now()
+    by_timeout: Dict[int, Dict[str, Any]] = {}
+    for pk, by_day in values.items():
+        for d, v in by_day.items():
+            timeout = _timeout((expires or {}).get(d), now)
+            if timeout > 0:
+                by_timeout.setdefault(timeout, {})[keys[pk][d]] = v
+
+    for timeout, entries in by_timeout.items():
+        cache.set_many(entries, timeout=timeout)
+
+
+def _timeout(expires_at: Optional[datetime], now: datetime) -> int:
+    if expires_at is None:
+        return CACHE_TTL
+    return min(CACHE_TTL, math.ceil((expires_at - now).total_seconds()))
+
+
+def date_range(start: date, end: date) -> List[date]:
+    """Все даты от `start` до `end` включительно."""
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
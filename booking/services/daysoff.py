@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from booking.models import DaysOff
+
+
+_VERSION_KEY = "availability:daysoff:version"
+
+
+class DaysOffIndex:
+    """Выходные периоды, слитые в непересекающиеся отсортированные интервалы."""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, ranges: Iterable[Tuple[date, date]]):
+        self.starts: List[date] = []
+        self.ends: List[date] = []
+        for start, end in sorted(ranges):
+            # соседние и пересекающиеся периоды склеиваем
+            if self.ends and start <= self.ends[-1] + timedelta(days=1):
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+
+    def __contains__(self, day: date) -> bool:
+        i = bisect_right(self.starts, day) - 1
+        return i >= 0 and day <= self.ends[i]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+# индекс живёт в памяти процесса; версия в общем кеше говорит, что он устарел
+_index: Optional[DaysOffIndex] = None
+_index_version: Optional[str] = None
+
+
+def _current_version() -> str:
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = uuid4().hex[:12]
+        if not cache.add(_VERSION_KEY, version, timeout=None):
+            version = cache.get(_VERSION_KEY) or version
+    return version
+
+
+def get_index() -> DaysOffIndex:
+    """Индекс выходных; перестраивается одним запросом после изменения любого DaysOff."""
+    global _index, _index_version
+    version = _current_version()
+    index = _index
+    if index is None or version != _index_version:
+        index = DaysOffIndex(DaysOff.objects.order_by().values_list("start", "end"))
+        _index, _index_version = index, version
+    return index
+
+
+def invalidate() -> None:
+    """Пометить индекс устаревшим во всех процессах."""
+    global _index
+    _index = None
+    cache.set(_VERSION_KEY, uuid4().hex[:12], timeout=None)
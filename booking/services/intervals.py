@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# интервал занятости в секундах от начала рабочего дня: [start, end)
+Interval = Tuple[int, int]
+
+CELL: int = 60  # размер ячейки карты занятости, сек
+
+
+def iter_free_slot_offsets(
+    span: int,
+    duration: int,
+    step: int,
+    bookings: Sequence[Interval],
+    timeoffs: Sequence[Interval],
+) -> Iterator[int]:
+    """
+    Лениво выдавать смещения начал свободных слотов за один проход по занятости.
+
+    `bookings` и `timeoffs` должны быть отсортированы по началу. Курсор движется
+    так же, как в сеточном переборе: при пересечении прыгает на конец первой
+    мешающей брони (брони проверяются раньше перерывов), иначе все слоты
+    свободного промежутка до ближайшей занятости выдаются сразу с шагом `step`.
+    Генератор останавливается там, где его перестали читать.
+    """
+    last: int = span - duration  # последнее допустимое начало
+    cursor: int = 0
+    bi = ti = 0
+    nb, nt = len(bookings), len(timeoffs)
+
+    while cursor <= last:
+        # всё, что закончилось до курсора, больше ни на что не влияет
+        while bi < nb and bookings[bi][1] <= cursor:
+            bi += 1
+        while ti < nt and timeoffs[ti][1] <= cursor:
+            ti += 1
+
+        window_end = cursor + duration
+
+        if bi < nb and bookings[bi][0] < window_end:
+            cursor = max(cursor + step, bookings[bi][1])
+            continue
+
+        if ti < nt and timeoffs[ti][0] < window_end:
+            cursor = max(cursor + step, timeoffs[ti][1])
+            continue
+
+        # свободный промежуток до ближайшей занятости (или конца дня)
+        gap_end = span
+        if bi < nb and bookings[bi][0] < gap_end:
+            gap_end = bookings[bi][0]
+        if ti < nt and timeoffs[ti][0] < gap_end:
+            gap_end = timeoffs[ti][0]
+
+        stop = gap_end - duration
+        emitted = range(cursor, stop + 1, step)
+        cursor += len(emitted) * step
+        yield from emitted
+
+
+class DayTimeline:
+    """
+    Занятость одного дня, общая для всех услуг: брони с буферами, перерывы и
+    рабочие часы. Строится один раз на день; услуги отличаются только длиной слота.
+
+    `cells` — карта занятости по минутам (1 — минута занята целиком). По ней
+    окно «N свободных минут подряд» ищется одним поиском подстроки, и дни, где
+    услуга заведомо не помещается, отсекаются без прохода по интервалам.
+
+    `expires_at` — когда истечёт ближайшая PENDING-блокировка дня: после этого
+    занятость уже другая, хотя в БД ничего не записано.
+    """
+
+    __slots__ = ("origin", "span", "bookings", "timeoffs", "cells", "expires_at")
+
+    def __init__(
+        self,
+        origin: Optional[datetime],
+        span: int,
+        bookings: Iterable[Interval] = (),
+        timeoffs: Iterable[Interval] = (),
+        expires_at: Optional[datetime] = None,
+    ):
+        self.origin = origin
+        self.expires_at = expires_at
+        self.span = max(span, 0)
+        self.bookings: List[Interval] = sorted(bookings, key=itemgetter(0))
+        self.timeoffs: List[Interval] = sorted(timeoffs, key=itemgetter(0))
+        self.cells: bytearray = _occupancy(self.span, self.bookings, self.timeoffs)
+
+    def has_window(self, minutes: int) -> bool:
+        """Есть ли `minutes` свободных минут подряд (необходимое условие для слота)."""
+        if minutes > len(self.cells):
+            return False
+        return self.cells.find(bytes(minutes)) != -1
+
+    def iter_slot_offsets(self, duration_min: int, grid_step: int) -> Iterator[int]:
+        """Смещения начал свободных слотов услуги длительностью `duration_min`."""
+        if not self.has_window(duration_min):
+            return iter(())
+        return iter_free_slot_offsets(
+            self.span, duration_min * 60, grid_step * 60, self.bookings, self.timeoffs
+        )
+
+    def has_slot(self, duration_min: int, grid_step: int) -> bool:
+        """Есть ли хоть один слот: проход останавливается на первом подходящем промежутке."""
+        return next(self.iter_slot_offsets(duration_min, grid_step), None) is not None
+
+    def iter_slots(self, duration_min: int, grid_step: int) -> Iterator[Dict[str, datetime]]:
+        """Свободные слоты в формате `{"start", "end"}`, по одному."""
+        duration = timedelta(minutes=duration_min)
+        for offset in self.iter_slot_offsets(duration_min, grid_step):
+            start = self.origin + timedelta(seconds=offset)
+            yield {"start": start, "end": start + duration}
+
+    def slots(self, duration_min: int, grid_step: int) -> List[Dict[str, datetime]]:
+        """Все свободные слоты списком."""
+        return list(self.iter_slots(duration_min, grid_step))
+
+
+def _occupancy(span: int, *sources: Sequence[Interval]) -> bytearray:
+    """
+    Поминутная карта занятости. Минута помечается занятой, только если интервал
+    покрывает её целиком, — так свободное окно в секундах всегда даёт не меньше
+    стольких же свободных ячеек, и проверка по карте не отсекает лишнего.
+    """
+    cells = bytearray(-(-span // CELL))
+    for source in sources:
+        for start, end in source:
+            first = max(-(-start // CELL), 0)
+            last = min(end, span) // CELL
+            if last > first:
+                cells[first:last] = b"\x01" * (last - first)
+    return cells
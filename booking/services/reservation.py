@@ -0,0 +1,70 @@
+from datetime import date, datetime
+from typing import Any
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from booking.models import Booking
+from booking.services.scheduler import GRID_STEP, is_slot_free
+from services.models import Service
+
+
+# первый ключ pg_advisory_xact_lock: пространство блокировок бронирования
+_LOCK_NAMESPACE: int = 0x626B  # "bk"
+
+
+class SlotUnavailable(RuntimeError):
+    pass
+
+
+def reserve_slot(
+    service: Service,
+    start: datetime,
+    grid_step: int = GRID_STEP,
+    **fields: Any,
+) -> Booking:
+    """
+    Атомарно занять слот услуги, начинающийся в `start`, и вернуть созданную бронь.
+
+    Брони одного дня сериализуются транзакционной advisory-блокировкой на дату:
+    под ней занятость перечитывается из БД и бронь вставляется, поэтому две
+    пересекающиеся брони не пройдут, а резервы на разные дни друг друга не ждут.
+    `fields` — остальные поля Booking (клиент, язык, статус...).
+    Если слот занят, вне сетки или уже прошёл — SlotUnavailable.
+    """
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if start <= timezone.now():
+        raise SlotUnavailable("Slot is in the past.")
+
+    try:
+        with transaction.atomic():
+            _lock_day(timezone.localdate(start))
+
+            if not is_slot_free(service, start, grid_step):
+                raise SlotUnavailable("Slot is already taken.")
+
+            # истёкшая PENDING-бронь слот не занимает, но держит uniq_start_single_master
+            Booking.objects.filter(
+                starts_at=start,
+                status=Booking.Status.PENDING,
+                lock_expires_at__lte=timezone.now(),
+            ).delete()
+
+            booking = Booking(service=service, starts_at=start, **fields)
+            booking.save()
+    except IntegrityError as exc:
+        # вне Postgres блокировки нет — последним рубежом остаётся уникальность начала
+        raise SlotUnavailable("Slot is already taken.") from exc
+
+    return booking
+
+
+def _lock_day(day: date) -> None:
+    """Транзакционная блокировка дня; снимается при commit/rollback. Только Postgres."""
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(%s, %s)", [_LOCK_NAMESPACE, day.toordinal()]
+        )
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+import asyncio
+import calendar
 from datetime import datetime, date, timedelta, time
-from typing import List, Dict
+from typing import Any, Iterable, Iterator, List, Dict, NamedTuple, Optional, Tuple
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db.models import QuerySet
 from django.utils import timezone
 
-from booking.models import Booking, DaysOff, TimeOff
+from booking.models import Booking, TimeOff
+from booking.services import availability_cache, daysoff
+from booking.services.daysoff import DaysOffIndex
+from booking.services.intervals import DayTimeline, Interval
 from services.models import Service
 
 
@@ -16,6 +23,45 @@ WORK_START: time = time(settings.WORK_START, 0)   # например, 10:00
 WORK_END: time = time(settings.WORK_END, 0)       # например, 20:00
 GRID_STEP: int = settings.GRID_STEP               # шаг сетки, мин
 
+_SECOND: timedelta = timedelta(seconds=1)
+
+# бронь в виде (начало, конец с учётом буфера, конец PENDING-блокировки или None)
+BusyRow = Tuple[datetime, datetime, Optional[datetime]]
+
+MAX_PAGE_DAYS: int = 62  # самая длинная страница календаря, дней
+
+
+class DaysPage(NamedTuple):
+    """Страница календаря: бит i в `mask` — день `start + i` доступен."""
+
+    start: date
+    end: date  # включительно
+    mask: int
+
+    @classmethod
+    def from_dates(cls, start: date, end: date, available: Iterable[date]) -> "DaysPage":
+        mask = 0
+        for d in available:
+            mask |= 1 << (d - start).days
+        return cls(start=start, end=end, mask=mask)
+
+    def dates(self) -> List[date]:
+        return [
+            self.start + timedelta(days=i)
+            for i in range((self.end - self.start).days + 1)
+            if self.mask >> i & 1
+        ]
+
+    def iso_dates(self) -> List[str]:
+        return [d.isoformat() for d in self.dates()]
+
+    def bits(self) -> str:
+        """Маска строкой: i-й символ — день `start + i` ("1" — доступен)."""
+        return "".join(
+            "1" if self.mask >> i & 1 else "0"
+            for i in range((self.end - self.start).days + 1)
+        )
+
 
 def get_available_days(
     service: Service,
@@ -23,155 +69,464 @@ def get_available_days(
     grid_step: int = GRID_STEP,
 ) -> List[date]:
     """Вернуть список доступных дней (не воскресенье, не выходные, есть свободные слоты)."""
+    return get_available_days_bulk([service], days_ahead, grid_step)[service.pk]
+
+
+def get_available_slots(
+    service: Service,
+    day: date,
+    grid_step: int = GRID_STEP,
+) -> List[Dict[str, datetime]]:
+    """Вернуть доступные слоты на конкретный день."""
+    return get_available_slots_bulk([service], day, grid_step)[service.pk]
+
+
+def get_available_days_bulk(
+    services: Iterable[Service],
+    days_ahead: int = 60,
+    grid_step: int = GRID_STEP,
+) -> Dict[int, List[date]]:
+    """
+    Доступные дни сразу для нескольких услуг: {service_id: [дни]}.
+    Брони, перерывы и выходные за период читаются один раз на всех.
+    """
     today: date = timezone.localdate()
-    end_date: date = today + timedelta(days=days_ahead)
-    now: datetime = timezone.now()
-
-    # все брони в диапазоне
-    all_bookings: List[Booking] = list(
-        Booking.objects.filter(starts_at__date__range=(today, end_date))
-        .exclude(status=Booking.Status.CANCELLED)
-        .exclude(
-            status=Booking.Status.PENDING,
-            created_at__lt=now - LOCK_TIMEOUT,
-        )
-    )
+    days: List[date] = [today + timedelta(days=offset) for offset in range(days_ahead)]
+    return _available_days(services, days, grid_step)
 
-    # группировка броней по дню
-    bookings_by_day: Dict[date, List[Booking]] = {}
-    for b in all_bookings:
-        bookings_by_day.setdefault(b.starts_at.date(), []).append(b)
 
-    # timeoffs по дню
-    all_timeoffs: List[TimeOff] = list(TimeOff.objects.filter(date__range=(today, end_date)))
-    timeoffs_by_day: Dict[date, List[TimeOff]] = {}
-    for t in all_timeoffs:
-        timeoffs_by_day.setdefault(t.date, []).append(t)
+def get_available_days_page(
+    service: Service,
+    start: date,
+    end: date,
+    grid_step: int = GRID_STEP,
+) -> DaysPage:
+    """
+    Доступные дни в окне [start, end] в виде компактной страницы. Каждая страница
+    читает из БД только своё окно, а дни кешируются независимо от соседних страниц.
+    Прошедшие дни недоступны.
+    """
+    available = _available_days([service], _page_days(start, end), grid_step)[service.pk]
+    return DaysPage.from_dates(start, end, available)
 
-    # выходные дни
-    all_daysoff: List[DaysOff] = list(
-        DaysOff.objects.filter(start__lte=end_date, end__gte=today)
+
+def get_available_month(
+    service: Service,
+    year: int,
+    month: int,
+    grid_step: int = GRID_STEP,
+) -> DaysPage:
+    """Страница доступных дней за календарный месяц."""
+    last_day: int = calendar.monthrange(year, month)[1]
+    return get_available_days_page(
+        service, date(year, month, 1), date(year, month, last_day), grid_step
     )
 
-    result: List[date] = []
-    for offset in range(days_ahead):
-        current_day: date = today + timedelta(days=offset)
 
-        # воскресенье
-        if current_day.weekday() == 6:
-            continue
+def _page_days(start: date, end: date) -> List[date]:
+    """Дни страницы [start, end] начиная с сегодняшнего."""
+    if end < start:
+        raise ValueError("end must not be earlier than start")
+    if (end - start).days >= MAX_PAGE_DAYS:
+        raise ValueError(f"page must not be longer than {MAX_PAGE_DAYS} days")
 
-        # проверка DaysOff
-        if any(d.start <= current_day <= d.end for d in all_daysoff):
-            continue
+    today: date = timezone.localdate()
+    return [d for d in availability_cache.date_range(start, end) if d >= today]
+
+
+def _available_days(
+    services: Iterable[Service],
+    days: List[date],
+    grid_step: int,
+) -> Dict[int, List[date]]:
+    """Отобрать доступные дни из `days` (по возрастанию) для каждой услуги, с кешем по дням."""
+    services = list(services)
+    days = [d for d in days if d.weekday() != 6]  # воскресенье
+    if not days or not services:
+        return {s.pk: [] for s in services}
+
+    # считаем только дни, которых нет в кеше
+    known, keys = availability_cache.lookup_many("day", services, days, grid_step)
+    missing: List[date] = _missing_days(services, days, known)
+    if missing:
+        timelines = _load_timelines(missing)
+        computed = _fill_days(services, days, known, timelines, grid_step)
+        availability_cache.store_many(computed, keys, _expiries(timelines))
+
+    return {s.pk: [d for d in days if known[s.pk][d]] for s in services}
+
+
+def _missing_days(
+    services: List[Service],
+    days: List[date],
+    known: Dict[int, Dict[date, Any]],
+) -> List[date]:
+    return sorted({d for s in services for d in days if d not in known[s.pk]})
+
+
+def _fill_days(
+    services: List[Service],
+    days: List[date],
+    known: Dict[int, Dict[date, bool]],
+    timelines: Dict[date, Optional[DayTimeline]],
+    grid_step: int,
+) -> Dict[int, Dict[date, bool]]:
+    """Досчитать промахи кеша по готовым timeline; `known` дополняется на месте."""
+    computed: Dict[int, Dict[date, bool]] = {}
+    for service in services:
+        computed[service.pk] = {
+            d: _has_slots(timelines[d], service, grid_step)
+            for d in days
+            if d not in known[service.pk]
+        }
+        known[service.pk].update(computed[service.pk])
+    return computed
+
+
+def get_available_slots_bulk(
+    services: Iterable[Service],
+    day: date,
+    grid_step: int = GRID_STEP,
+) -> Dict[int, List[Dict[str, datetime]]]:
+    """Доступные слоты на один день сразу для нескольких услуг: {service_id: [слоты]}."""
+    services = list(services)
+    if day.weekday() == 6:  # воскресенье
+        return {s.pk: [] for s in services}
 
-        bookings: List[Booking] = bookings_by_day.get(current_day, [])
-        timeoffs: List[TimeOff] = timeoffs_by_day.get(current_day, [])
+    known, keys = availability_cache.lookup_many("slots", services, [day], grid_step)
+    missing: List[Service] = [s for s in services if day not in known[s.pk]]
+    if missing:
+        timelines = _load_timelines([day])
+        computed = _fill_slots(missing, day, known, timelines[day], grid_step)
+        availability_cache.store_many(computed, keys, _expiries(timelines))
 
-        slots: List[Dict[str, datetime]] = _generate_slots(
-            service, current_day, bookings, timeoffs, grid_step
-        )
+    return {s.pk: known[s.pk][day] for s in services}
 
-        if slots:
-            result.append(current_day)
 
-    return result
+def _fill_slots(
+    services: List[Service],
+    day: date,
+    known: Dict[int, Dict[date, List[Dict[str, datetime]]]],
+    timeline: Optional[DayTimeline],
+    grid_step: int,
+) -> Dict[int, Dict[date, List[Dict[str, datetime]]]]:
+    """Посчитать слоты дня для услуг без записи в кеше; `known` дополняется на месте."""
+    computed: Dict[int, Dict[date, List[Dict[str, datetime]]]] = {}
+    for service in services:
+        slots = timeline.slots(service.duration_min, grid_step) if timeline else []
+        computed[service.pk] = {day: slots}
+        known[service.pk][day] = slots
+    return computed
+
+
+def has_free_slot(
+    service: Service,
+    day: date,
+    grid_step: int = GRID_STEP,
+) -> bool:
+    """Есть ли на день хотя бы один свободный слот (без построения полного списка)."""
+    if day.weekday() == 6:  # воскресенье
+        return False
 
+    known, keys = availability_cache.lookup_many("day", [service], [day], grid_step)
+    if day not in known[service.pk]:
+        timelines = _load_timelines([day])
+        result = _has_slots(timelines[day], service, grid_step)
+        availability_cache.store_many({service.pk: {day: result}}, keys, _expiries(timelines))
+        return result
+    return known[service.pk][day]
 
-def get_available_slots(
+
+def iter_available_slots(
     service: Service,
     day: date,
     grid_step: int = GRID_STEP,
-) -> List[Dict[str, datetime]]:
-    """Вернуть доступные слоты на конкретный день."""
+) -> Iterator[Dict[str, datetime]]:
+    """
+    Свободные слоты дня по одному: можно взять первые N через `itertools.islice`,
+    не считая остальные. Частичный результат в кеш не попадает.
+    """
     if day.weekday() == 6:  # воскресенье
-        return []
+        return
 
-    now: datetime = timezone.now()
+    known, _ = availability_cache.lookup_many("slots", [service], [day], grid_step)
+    if day in known[service.pk]:
+        yield from known[service.pk][day]
+        return
+
+    timeline: Optional[DayTimeline] = _load_timelines([day])[day]
+    if timeline is not None:
+        yield from timeline.iter_slots(service.duration_min, grid_step)
 
-    bookings: List[Booking] = list(
-        Booking.objects.filter(starts_at__date=day)
-        .exclude(status=Booking.Status.CANCELLED)
-        .exclude(
-            status=Booking.Status.PENDING,
-            created_at__lt=now - LOCK_TIMEOUT,
-        )
-    )
 
-    timeoffs: List[TimeOff] = list(TimeOff.objects.filter(date=day))
+def is_slot_free(
+    service: Service,
+    start: datetime,
+    grid_step: int = GRID_STEP,
+) -> bool:
+    """
+    Свободен ли слот услуги, начинающийся в `start`, — по данным БД, минуя кеш.
+    Подходят только начала, которые отдаёт `get_available_slots`.
+    """
+    day: date = timezone.localdate(start)
+    if day.weekday() == 6:  # воскресенье
+        return False
 
-    return _generate_slots(service, day, bookings, timeoffs, grid_step)
+    timeline: Optional[DayTimeline] = _load_timelines([day])[day]
+    if timeline is None:
+        return False
 
+    wanted: int = _offset(start, timeline.origin)
+    for offset in timeline.iter_slot_offsets(service.duration_min, grid_step):
+        if offset >= wanted:
+            return offset == wanted
+    return False
 
-def _generate_slots(
+
+async def aget_available_days(
+    service: Service,
+    days_ahead: int = 60,
+    grid_step: int = GRID_STEP,
+) -> List[date]:
+    """Асинхронный `get_available_days` на async ORM — не занимает поток воркера на время запросов."""
+    today: date = timezone.localdate()
+    days: List[date] = [today + timedelta(days=offset) for offset in range(days_ahead)]
+    return (await _aavailable_days([service], days, grid_step))[service.pk]
+
+
+async def aget_available_days_page(
+    service: Service,
+    start: date,
+    end: date,
+    grid_step: int = GRID_STEP,
+) -> DaysPage:
+    """Асинхронный `get_available_days_page`."""
+    available = (await _aavailable_days([service], _page_days(start, end), grid_step))[service.pk]
+    return DaysPage.from_dates(start, end, available)
+
+
+async def aget_available_slots(
     service: Service,
     day: date,
-    bookings: List[Booking],
-    timeoffs: List[TimeOff],
     grid_step: int = GRID_STEP,
 ) -> List[Dict[str, datetime]]:
-    """Сгенерировать все свободные слоты для дня с учётом броней и перерывов."""
-    work_start: datetime = timezone.make_aware(datetime.combine(day, WORK_START))
-    work_end: datetime = timezone.make_aware(datetime.combine(day, WORK_END))
+    """Асинхронный `get_available_slots`."""
+    if day.weekday() == 6:  # воскресенье
+        return []
 
-    duration: timedelta = timedelta(minutes=service.duration_min)
-    buffer: timedelta = timedelta(minutes=service.buffer_after_min)
-    step: timedelta = timedelta(minutes=grid_step)
+    known, keys = await _alookup_many("slots", [service], [day], grid_step)
+    if day not in known[service.pk]:
+        timelines = await _aload_timelines([day])
+        computed = _fill_slots([service], day, known, timelines[day], grid_step)
+        await _astore_many(computed, keys, _expiries(timelines))
 
-    slots: List[Dict[str, datetime]] = []
-    current: datetime = work_start
+    return known[service.pk][day]
 
-    # сортируем брони и тайм-оффы для удобства
-    bookings = sorted(bookings, key=lambda b: b.starts_at)
-    timeoffs = sorted(timeoffs, key=lambda t: t.start or time.min)
 
-    while current <= work_end:
-        candidate_start: datetime = current
-        candidate_end: datetime = candidate_start + duration
+async def _aavailable_days(
+    services: List[Service],
+    days: List[date],
+    grid_step: int,
+) -> Dict[int, List[date]]:
+    """Асинхронный `_available_days`."""
+    days = [d for d in days if d.weekday() != 6]  # воскресенье
+    if not days or not services:
+        return {s.pk: [] for s in services}
 
-        # если услуга выходит за рабочий день → стоп
-        if candidate_end > work_end:
-            break
+    known, keys = await _alookup_many("day", services, days, grid_step)
+    missing: List[date] = _missing_days(services, days, known)
+    if missing:
+        timelines = await _aload_timelines(missing)
+        computed = _fill_days(services, days, known, timelines, grid_step)
+        await _astore_many(computed, keys, _expiries(timelines))
 
-        # флаг пересечения
-        blocked = False
+    return {s.pk: [d for d in days if known[s.pk][d]] for s in services}
 
-        # проверка бронирований
-        for b in bookings:
-            b_start: datetime = b.starts_at
-            b_end: datetime = b.ends_at or (
-                b.starts_at + timedelta(minutes=b.service.duration_min)
-            )
-            b_end = b_end + timedelta(minutes=b.service.buffer_after_min)
 
-            # если слот пересекается с бронью
-            if not (candidate_end <= b_start or candidate_start >= b_end):
-                blocked = True
-                current = max(current + step, b_end)
-                break            
+# кеш не трогает БД, поэтому его можно звать из любого потока
+_alookup_many = sync_to_async(availability_cache.lookup_many, thread_sensitive=False)
+_astore_many = sync_to_async(availability_cache.store_many, thread_sensitive=False)
+
+
+def _expiries(timelines: Dict[date, Optional[DayTimeline]]) -> Dict[date, Optional[datetime]]:
+    """Когда ответ по дню устареет сам, без записи в БД: истечение ближайшей блокировки."""
+    return {d: t.expires_at if t else None for d, t in timelines.items()}
 
-        if blocked:
-            continue
 
-        # проверка timeoff
-        for to in timeoffs:
-            if not (to.start and to.end):
-                continue
-            to_start: datetime = timezone.make_aware(datetime.combine(day, to.start))
-            to_end: datetime = timezone.make_aware(datetime.combine(day, to.end))
+def _has_slots(timeline: Optional[DayTimeline], service: Service, grid_step: int) -> bool:
+    return timeline is not None and timeline.has_slot(service.duration_min, grid_step)
 
-            if candidate_start < to_end and candidate_end > to_start:
-                blocked = True
-                current = max(current + step, to_end)
-                break
 
-        if blocked:
+def _load_timelines(days: List[date]) -> Dict[date, Optional[DayTimeline]]:
+    """
+    Прочитать брони, перерывы и выходные за период и собрать занятость каждого дня
+    (дни идут по возрастанию). Для выходных (DaysOff) — None.
+    """
+    bookings_qs, timeoffs_qs = _schedule_queries(days[0], days[-1], timezone.now())
+    return _assemble_timelines(
+        days,
+        # все брони в диапазоне — уже в виде (начало, конец с буфером)
+        [_busy_row(*row) for row in bookings_qs],
+        list(timeoffs_qs),
+        # выходные дни — общий для процесса индекс, поиск за O(log n)
+        daysoff.get_index(),
+    )
+
+
+async def _aload_timelines(days: List[date]) -> Dict[date, Optional[DayTimeline]]:
+    """Асинхронный `_load_timelines`: три независимых чтения запускаются одновременно."""
+    bookings_qs, timeoffs_qs = _schedule_queries(days[0], days[-1], timezone.now())
+
+    async def bookings() -> List[BusyRow]:
+        return [_busy_row(*row) async for row in bookings_qs]
+
+    async def timeoffs() -> List[TimeOff]:
+        return [t async for t in timeoffs_qs]
+
+    all_bookings, all_timeoffs, days_off = await asyncio.gather(
+        bookings(), timeoffs(), sync_to_async(daysoff.get_index)()
+    )
+    return _assemble_timelines(days, all_bookings, all_timeoffs, days_off)
+
+
+def _schedule_queries(
+    start_date: date,
+    end_date: date,
+    now: datetime,
+) -> Tuple[QuerySet, QuerySet[TimeOff]]:
+    """Запросы броней (строками) и перерывов за период; ещё не выполнены."""
+    range_start, range_end = _day_bounds(start_date, end_date)
+    bookings = _busy_rows_query(
+        Booking.objects.filter(starts_at__gte=range_start, starts_at__lt=range_end), now
+    )
+    timeoffs = TimeOff.objects.filter(date__range=(start_date, end_date))
+    return bookings, timeoffs
+
+
+def _assemble_timelines(
+    days: List[date],
+    all_bookings: List[BusyRow],
+    all_timeoffs: List[TimeOff],
+    days_off: DaysOffIndex,
+) -> Dict[date, Optional[DayTimeline]]:
+    # группировка броней по дню
+    bookings_by_day: Dict[date, List[BusyRow]] = {}
+    for row in all_bookings:
+        bookings_by_day.setdefault(timezone.localdate(row[0]), []).append(row)
+
+    # timeoffs по дню
+    timeoffs_by_day: Dict[date, List[TimeOff]] = {}
+    for t in all_timeoffs:
+        timeoffs_by_day.setdefault(t.date, []).append(t)
+
+    result: Dict[date, Optional[DayTimeline]] = {}
+    for current_day in days:
+        # проверка DaysOff
+        if current_day in days_off:
+            result[current_day] = None
             continue
 
-        # слот валиден
-        slots.append({"start": candidate_start, "end": candidate_end})
+        bookings: List[BusyRow] = bookings_by_day.get(current_day, [])
+        timeoffs: List[TimeOff] = timeoffs_by_day.get(current_day, [])
+
+        result[current_day] = _build_timeline(current_day, bookings, timeoffs)
+
+    return result
+
+
+def _day_bounds(start_date: date, end_date: date) -> Tuple[datetime, datetime]:
+    """
+    Полуинтервал [начало start_date, начало дня после end_date) в локальной зоне.
+    Фильтр по нему идёт по самому `starts_at` и использует индекс, в отличие от `__date`.
+    """
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min)),
+        timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)),
+    )
+
+
+def _busy_rows_query(bookings: QuerySet[Booking], now: datetime) -> QuerySet:
+    """
+    Активные брони одним JOIN-запросом в виде компактных строк для `_busy_row`.
+    Модели Booking/Service не создаются, поэтому нет N+1 на `b.service`;
+    все фильтры покрывает частичный индекс booking_active_starts_idx.
+    """
+    return (
+        bookings.active(now)
+        .order_by()
+        .values_list(
+            "starts_at",
+            "ends_at",
+            "service__duration_min",
+            "service__buffer_after_min",
+            "lock_expires_at",
+        )
+    )
+
+
+def _busy_row(
+    starts_at: datetime,
+    ends_at: Optional[datetime],
+    duration_min: int,
+    buffer_after_min: int,
+    lock_expires_at: Optional[datetime] = None,
+) -> BusyRow:
+    """Интервал занятости брони: конец услуги (или начало + длительность) плюс буфер."""
+    end: datetime = ends_at or starts_at + timedelta(minutes=duration_min)
+    return starts_at, end + timedelta(minutes=buffer_after_min), lock_expires_at
+
+
+def _generate_slots(
+    service: Service,
+    day: date,
+    bookings: List[BusyRow],
+    timeoffs: List[TimeOff],
+    grid_step: int = GRID_STEP,
+) -> List[Dict[str, datetime]]:
+    """Сгенерировать все свободные слоты для дня с учётом броней и перерывов."""
+    return _build_timeline(day, bookings, timeoffs).slots(service.duration_min, grid_step)
+
+
+def _build_timeline(
+    day: date,
+    bookings: List[BusyRow],
+    timeoffs: List[TimeOff],
+) -> DayTimeline:
+    """Собрать занятость дня, не зависящую от услуги."""
+    work_start: datetime = timezone.make_aware(datetime.combine(day, WORK_START))
+    work_end: datetime = timezone.make_aware(datetime.combine(day, WORK_END))
+    day_start: datetime = datetime.combine(day, WORK_START)
+
+    # брони с буфером → интервалы в секундах от начала рабочего дня
+    busy: List[Interval] = [
+        (_offset(b_start, work_start), _offset_ceil(b_end, work_start))
+        for b_start, b_end, _ in bookings
+    ]
+
+    # перерывы считаем в локальном времени дня, без make_aware
+    breaks: List[Interval] = [
+        (
+            _offset(datetime.combine(day, to.start), day_start),
+            _offset_ceil(datetime.combine(day, to.end), day_start),
+        )
+        for to in timeoffs
+        if to.start and to.end
+    ]
+
+    return DayTimeline(
+        origin=work_start,
+        span=_offset(work_end, work_start),
+        bookings=busy,
+        timeoffs=breaks,
+        expires_at=min((e for _, _, e in bookings if e is not None), default=None),
+    )
+
+
+def _offset(moment: datetime, origin: datetime) -> int:
+    """Смещение в секундах от начала рабочего дня (с округлением вниз)."""
+    return (moment - origin) // _SECOND
 
-        # шаг вперёд
-        current += step
 
-    return slots
+def _offset_ceil(moment: datetime, origin: datetime) -> int:
+    """Смещение в секундах с округлением вверх — конец занятости не должен сжиматься."""
+    return -((origin - moment) // _SECOND)
@@ -1,12 +1,19 @@
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Set
 
-from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
 from celery import current_app
 
-from booking.models import Booking
+from booking.models import Booking, DaysOff, TimeOff
+from booking.services import availability_cache, daysoff
+from services.models import Service
+from notifications import publisher
 from notifications.models import OutboxEvent
 from notifications.tasks import (
     send_outbox_event,
@@ -14,6 +21,14 @@ from notifications.tasks import (
 )
 
 
+def _local_time(value: Optional[datetime]) -> Optional[str]:
+    if not value:
+        return None
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.strftime("%H:%M")
+
+
 def _payload_base(b: Booking) -> dict:
     return {
         "service_id": b.service_id,
@@ -23,6 +38,9 @@ def _payload_base(b: Booking) -> dict:
         "customer_phone": b.customer_phone,
         "starts_at": b.starts_at.isoformat() if b.starts_at else None,
         "ends_at": b.ends_at.isoformat() if b.ends_at else None,
+        # готовое время для шаблонов: воркер не разбирает ISO-строки на каждой отправке
+        "starts_time": _local_time(b.starts_at),
+        "ends_time": _local_time(b.ends_at),
         "duration_minutes": b.service.duration_min,
         "date": b.date.isoformat() if b.date else None,
         "language": b.language,
@@ -35,46 +53,52 @@ def booking_created_outbox(sender, instance: Booking, **kwargs):
         now = timezone.now()
         local_today = timezone.localdate()
 
-        master_notify = OutboxEvent.objects.create(
-            event_type="master_notify",
-            execute_at=now,
-            payload={
-                **_payload_base(instance),
-                "reason": f"booking_{instance.status.lower()}",
-            },
-            booking_id=instance.id,
-        )
-        send_outbox_event.delay(master_notify.id)
-        
-        client_notify = OutboxEvent.objects.create(
-            event_type="client_notify",
-            execute_at=now,
-            payload={
-                **_payload_base(instance),
-                "reason": f"booking_{instance.status.lower()}",
-            },
-            booking_id=instance.id,
-        )
-        send_outbox_event.delay(client_notify.id)
-
-
+        payload = {
+            **_payload_base(instance),
+            "reason": f"booking_{instance.status.lower()}",
+        }
         remind_at = instance.starts_at - timedelta(hours=1)
 
-        client_reminder = OutboxEvent.objects.create(
-            event_type="client_reminder",
-            execute_at=remind_at,
-            payload={
-                **_payload_base(instance),
-                "reason": "booking_confirmed",
-                "reminder_offset_minutes": 60, # на час раньше
-            },
-            booking_id=instance.id,
-        )
+        # три события одним INSERT
+        master_notify, client_notify, client_reminder = OutboxEvent.objects.bulk_create([
+            OutboxEvent(
+                event_type="master_notify",
+                execute_at=now,
+                payload=payload,
+                booking_id=instance.id,
+            ),
+            OutboxEvent(
+                event_type="client_notify",
+                execute_at=now,
+                payload=payload,
+                booking_id=instance.id,
+            ),
+            OutboxEvent(
+                event_type="client_reminder",
+                execute_at=remind_at,
+                payload={
+                    **payload,
+                    "reason": "booking_confirmed",
+                    "reminder_offset_minutes": 60, # на час раньше
+                },
+                booking_id=instance.id,
+            ),
+        ])
 
-        if remind_at.date() == local_today and remind_at > now:
-            register_outbox_event.delay(client_reminder.id)
+        if settings.OUTBOX_RELAY:
+            return  # события заберёт relay_outbox, когда наступит execute_at
+
+        tasks = [
+            send_outbox_event.s(master_notify.id),
+            send_outbox_event.s(client_notify.id),
+        ]
+        if timezone.localdate(remind_at) == local_today and remind_at > now:
+            tasks.append(register_outbox_event.s(client_reminder.id))
         # иначе ничего не делаем: ночной beat сам найдёт и зарегистрирует
 
+        # после коммита, одной группой с остальными задачами транзакции
+        publisher.publish(*tasks)
+
 
 @receiver(post_save, sender=Booking)
 def cancel_outbox_on_booking_cancel(sender, instance: Booking, **kwargs):
@@ -94,4 +118,85 @@ def delete_outbox_events_on_booking_delete(sender, instance: Booking, **kwargs):
     if instance.id:
         deleted, _ = OutboxEvent.objects.filter(booking_id=instance.id).delete()
         if deleted:
-            print(f"[Outbox cleanup] Deleted {deleted} events for booking {instance.id}")
\ No newline at end of file
+            print(f"[Outbox cleanup] Deleted {deleted} events for booking {instance.id}")
+
+
+# --- инвалидация кеша доступности ---
+
+# поля, от которых зависит, какие даты затрагивает запись
+_DATE_FIELDS = {
+    Booking: ("starts_at",),
+    TimeOff: ("date",),
+    DaysOff: ("start", "end"),
+}
+
+
+def _affected_dates(instance) -> Set[date]:
+    if isinstance(instance, Booking):
+        return {timezone.localdate(instance.starts_at)} if instance.starts_at else set()
+    if isinstance(instance, TimeOff):
+        return {instance.date} if instance.date else set()
+    if isinstance(instance, DaysOff):
+        if not (instance.start and instance.end):
+            return set()
+        return set(availability_cache.date_range(instance.start, instance.end))
+    return set()
+
+
+@receiver(pre_save, sender=Booking)
+@receiver(pre_save, sender=TimeOff)
+@receiver(pre_save, sender=DaysOff)
+def remember_availability_dates(sender, instance, update_fields=None, **kwargs):
+    """Запомнить даты до изменения: перенос брони/перерыва освобождает старую дату."""
+    fields = _DATE_FIELDS[sender]
+    instance._availability_old_dates = set()
+    if not instance.pk or (update_fields is not None and not set(fields) & set(update_fields)):
+        return
+    old = sender.objects.filter(pk=instance.pk).first()
+    if old is not None:
+        instance._availability_old_dates = _affected_dates(old)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=TimeOff)
+@receiver(post_save, sender=DaysOff)
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=TimeOff)
+@receiver(post_delete, sender=DaysOff)
+def invalidate_availability(sender, instance, **kwargs):
+    days = _affected_dates(instance) | getattr(instance, "_availability_old_dates", set())
+    if days:
+        # после коммита: до него читатели и так видят старые данные
+        transaction.on_commit(lambda: availability_cache.invalidate_days(days))
+
+
+@receiver(post_save, sender=DaysOff)
+@receiver(post_delete, sender=DaysOff)
+def invalidate_daysoff_index(sender, instance: DaysOff, **kwargs):
+    transaction.on_commit(daysoff.invalidate)
+
+
+def _booked_dates(service_id: int) -> Set[date]:
+    """Даты с предстоящими активными бронями услуги."""
+    today_start = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    return set(
+        Booking.objects.active()
+        .filter(service_id=service_id, starts_at__gte=today_start)
+        .annotate(day=TruncDate("starts_at"))
+        .values_list("day", flat=True)
+        .distinct()
+    )
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service_availability(sender, instance: Service, **kwargs):
+    # после post_delete Django обнуляет instance.pk — id запоминаем сейчас
+    service_id = instance.pk
+
+    def invalidate():
+        availability_cache.invalidate_service(service_id)
+        # буфер после брони занимает время у всех услуг: сбрасываем даты её броней
+        availability_cache.invalidate_days(_booked_dates(service_id))
+
+    transaction.on_commit(invalidate)
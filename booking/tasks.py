@@ -1,20 +1,68 @@
+from typing import List
+
 from celery import shared_task
+from django.db import connections, transaction
 from django.utils import timezone
-from datetime import timedelta
-from django.conf import settings
 from booking.models import Booking
+from booking.services import availability_cache
+from notifications.models import OutboxEvent
+
+
+REAP_BATCH_SIZE = 500  # броней за одну транзакцию
 
 
 @shared_task
-def clean_old_pending_bookings():
+def clean_old_pending_bookings(batch_size: int = REAP_BATCH_SIZE):
+    """
+    Удалить PENDING-брони с истёкшей блокировкой пачками по `batch_size`.
+
+    Каждая пачка — короткая транзакция из двух DELETE по списку id: события
+    outbox и сами брони. Брони удаляются явным DELETE ... WHERE id IN, мимо
+    сигналов post_delete: обработчики Booking делали бы по запросу на каждую
+    бронь, а их работа выполняется здесь пачкой — события outbox удаляются
+    первым DELETE, версии затронутых дат сбрасываются после коммита.
+    На Booking нет внешних ключей, так что каскадов, которые пропустил бы
+    такой DELETE, тоже нет.
+    """
     now = timezone.now()
-    timeout = timedelta(minutes=settings.LOCK_TIMEOUT)
+    deleted = 0
+
+    while True:
+        with transaction.atomic():
+            # строки, которые сейчас подтверждают, пропускаем — заберём в следующий запуск
+            batch = list(
+                Booking.objects.filter(
+                    status=Booking.Status.PENDING,
+                    lock_expires_at__lte=now,
+                )
+                .select_for_update(skip_locked=True)
+                .order_by("pk")
+                .values_list("pk", "starts_at")[:batch_size]
+            )
+            if not batch:
+                break
+
+            ids = [pk for pk, _ in batch]
+            # у OutboxEvent нет сигналов и связей — Django удалит одним запросом
+            OutboxEvent.objects.filter(booking_id__in=ids).delete()
+            _delete_bookings(ids)
+
+            days = {timezone.localdate(starts_at) for _, starts_at in batch}
+            transaction.on_commit(lambda days=days: availability_cache.invalidate_days(days))
+
+        deleted += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    return f"Deleted {deleted} old pending bookings"
 
-    qs = Booking.objects.filter(
-        status=Booking.Status.PENDING,
-        created_at__lt=now - timeout,
-    )
-    count = qs.count()
-    qs.delete()
 
-    return f"Deleted {count} old pending bookings"
+def _delete_bookings(ids: List[int]) -> None:
+    using = Booking.objects.db
+    quote = connections[using].ops.quote_name
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(Booking._meta.db_table)} "
+            f"WHERE {quote(Booking._meta.pk.column)} IN ({', '.join(['%s'] * len(ids))})",
+            ids,
+        )
@@ -0,0 +1,852 @@
+import asyncio
+import random
+import threading
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Optional
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from booking.models import Booking, DaysOff, TimeOff
+from booking.tasks import clean_old_pending_bookings
+from booking.services import availability_cache, scheduler
+from booking.services.daysoff import DaysOffIndex
+from booking.services.intervals import DayTimeline
+from booking.services.reservation import SlotUnavailable, _lock_day, reserve_slot
+from booking.services.scheduler import (
+    WORK_END,
+    WORK_START,
+    _busy_row,
+    _generate_slots,
+    get_available_days,
+    get_available_days_bulk,
+    get_available_days_page,
+    get_available_month,
+    get_available_slots,
+    get_available_slots_bulk,
+    has_free_slot,
+    iter_available_slots,
+)
+from notifications.models import OutboxEvent
+from services.models import Service, ServiceCategory
+
+
+def _legacy_generate_slots(service, day, bookings, timeoffs, grid_step):
+    """Прежний сеточный перебор — эталон для проверки эквивалентности."""
+    work_start = timezone.make_aware(datetime.combine(day, WORK_START))
+    work_end = timezone.make_aware(datetime.combine(day, WORK_END))
+
+    duration = timedelta(minutes=service.duration_min)
+    step = timedelta(minutes=grid_step)
+
+    slots = []
+    current = work_start
+
+    bookings = sorted(bookings, key=lambda b: b.starts_at)
+    timeoffs = sorted(timeoffs, key=lambda t: t.start or time.min)
+
+    while current <= work_end:
+        candidate_start = current
+        candidate_end = candidate_start + duration
+
+        if candidate_end > work_end:
+            break
+
+        blocked = False
+
+        for b in bookings:
+            b_start = b.starts_at
+            b_end = b.ends_at or (
+                b.starts_at + timedelta(minutes=b.service.duration_min)
+            )
+            b_end = b_end + timedelta(minutes=b.service.buffer_after_min)
+
+            if not (candidate_end <= b_start or candidate_start >= b_end):
+                blocked = True
+                current = max(current + step, b_end)
+                break
+
+        if blocked:
+            continue
+
+        for to in timeoffs:
+            if not (to.start and to.end):
+                continue
+            to_start = timezone.make_aware(datetime.combine(day, to.start))
+            to_end = timezone.make_aware(datetime.combine(day, to.end))
+
+            if candidate_start < to_end and candidate_end > to_start:
+                blocked = True
+                current = max(current + step, to_end)
+                break
+
+        if blocked:
+            continue
+
+        slots.append({"start": candidate_start, "end": candidate_end})
+        current += step
+
+    return slots
+
+
+def _next_workday(days: int = 2, after: Optional[date] = None) -> date:
+    """Ближайший рабочий день (не воскресенье) не раньше чем через `days` дней от `after` или сегодня."""
+    day = (after or timezone.localdate()) + timedelta(days=days)
+    return day + timedelta(days=1) if day.weekday() == 6 else day
+
+
+def _make_service(duration_min: int = 30, **fields) -> Service:
+    """Услуга «Cut» в категории «Hair» — общая для тестов бронирования."""
+    category, _ = ServiceCategory.objects.get_or_create(name="Hair")
+    return Service.objects.create(
+        category=category, name="Cut", price=100, duration_min=duration_min, **fields
+    )
+
+
+class GenerateSlotsEquivalenceTests(SimpleTestCase):
+    """Интервальный движок должен выдавать ровно те же слоты, что и сеточный перебор."""
+
+    day = date(2025, 10, 14)
+
+    def _random_service(self, rnd):
+        return Service(
+            name="svc",
+            price=0,
+            duration_min=rnd.choice([5, 15, 30, 45, 50, 60, 90, 240]),
+            buffer_after_min=rnd.choice([0, 0, 5, 10, 15]),
+        )
+
+    def _random_schedule(self, rnd):
+        work_start = timezone.make_aware(datetime.combine(self.day, WORK_START))
+        minutes = (WORK_END.hour - WORK_START.hour) * 60
+
+        bookings = []
+        used = set()
+        for _ in range(rnd.randint(0, 12)):
+            offset = rnd.randint(-60, minutes + 30)
+            if rnd.random() < 0.2:
+                offset = offset * 60 + rnd.randint(0, 59)  # секунды вне сетки
+            else:
+                offset *= 60
+            if offset in used:
+                continue
+            used.add(offset)
+            starts_at = work_start + timedelta(seconds=offset)
+            svc = self._random_service(rnd)
+            ends_at = None
+            if rnd.random() < 0.7:
+                ends_at = starts_at + timedelta(minutes=svc.duration_min)
+            bookings.append(Booking(service=svc, starts_at=starts_at, ends_at=ends_at))
+
+        timeoffs = []
+        for _ in range(rnd.choice([0, 0, 1, 1, 2])):
+            if rnd.random() < 0.1:
+                timeoffs.append(TimeOff(date=self.day))
+                continue
+            a = rnd.randint(WORK_START.hour * 60 - 30, WORK_END.hour * 60)
+            b = a + rnd.randint(5, 180)
+            if b >= 24 * 60:
+                continue
+            timeoffs.append(
+                TimeOff(date=self.day, start=time(a // 60, a % 60), end=time(b // 60, b % 60))
+            )
+
+        return bookings, timeoffs
+
+    def _assert_same(self, service, bookings, timeoffs, grid_step):
+        expected = _legacy_generate_slots(service, self.day, bookings, timeoffs, grid_step)
+        rows = [
+            _busy_row(b.starts_at, b.ends_at, b.service.duration_min, b.service.buffer_after_min)
+            for b in bookings
+        ]
+        actual = _generate_slots(service, self.day, rows, timeoffs, grid_step)
+        self.assertEqual(
+            [(s["start"], s["end"]) for s in actual],
+            [(s["start"], s["end"]) for s in expected],
+        )
+
+    def test_empty_day(self):
+        service = Service(name="svc", price=0, duration_min=60, buffer_after_min=0)
+        self._assert_same(service, [], [], scheduler.GRID_STEP)
+
+    def test_service_longer_than_work_day(self):
+        service = Service(name="svc", price=0, duration_min=24 * 60, buffer_after_min=0)
+        self._assert_same(service, [], [], scheduler.GRID_STEP)
+
+    def test_randomized_schedules(self):
+        rnd = random.Random(20251014)
+        for _ in range(2000):
+            service = self._random_service(rnd)
+            bookings, timeoffs = self._random_schedule(rnd)
+            grid_step = rnd.choice([5, 10, 15, 30])
+            with self.subTest(
+                duration=service.duration_min,
+                grid_step=grid_step,
+                bookings=[(b.starts_at, b.ends_at) for b in bookings],
+                timeoffs=[(t.start, t.end) for t in timeoffs],
+            ):
+                self._assert_same(service, bookings, timeoffs, grid_step)
+
+
+class DaysOffIndexTests(SimpleTestCase):
+    def test_membership_over_merged_ranges(self):
+        d = date(2025, 1, 1)
+        index = DaysOffIndex(
+            [
+                (d + timedelta(days=10), d + timedelta(days=12)),
+                (d, d + timedelta(days=2)),
+                (d + timedelta(days=1), d + timedelta(days=4)),
+                (d + timedelta(days=5), d + timedelta(days=5)),
+            ]
+        )
+        self.assertEqual(len(index), 2)
+        blocked = {d + timedelta(days=i) for i in (0, 1, 2, 3, 4, 5, 10, 11, 12)}
+        for i in range(-3, 20):
+            day = d + timedelta(days=i)
+            self.assertEqual(day in index, day in blocked, day)
+
+
+class DayTimelineTests(SimpleTestCase):
+    def test_window_uses_fully_busy_minutes_only(self):
+        # 10 минут дня, занято [90 c, 300 c): целиком заняты минуты 2, 3, 4
+        timeline = DayTimeline(origin=None, span=600, bookings=[(90, 300)])
+        self.assertEqual(bytes(timeline.cells), b"\x00\x00\x01\x01\x01\x00\x00\x00\x00\x00")
+        self.assertTrue(timeline.has_window(5))
+        self.assertFalse(timeline.has_window(6))
+
+    def test_one_timeline_serves_every_duration(self):
+        rnd = random.Random(4)
+        day = GenerateSlotsEquivalenceTests.day
+        case = GenerateSlotsEquivalenceTests()
+        for _ in range(200):
+            bookings, timeoffs = case._random_schedule(rnd)
+            rows = [
+                _busy_row(b.starts_at, b.ends_at, b.service.duration_min, b.service.buffer_after_min)
+                for b in bookings
+            ]
+            timeline = scheduler._build_timeline(day, rows, timeoffs)
+            for duration in (15, 45, 90, 240):
+                service = Service(name="svc", price=0, duration_min=duration)
+                expected = _legacy_generate_slots(service, day, bookings, timeoffs, 10)
+                self.assertEqual(timeline.slots(duration, 10), expected)
+                self.assertEqual(timeline.has_slot(duration, 10), bool(expected))
+
+
+class AvailabilityQueryCountTests(TestCase):
+    """Число запросов не должно расти вместе с количеством броней."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = _make_service(buffer_after_min=10)
+        cls.day = _next_workday(1)
+        work_start = timezone.make_aware(datetime.combine(cls.day, WORK_START))
+        for i in range(5):
+            Booking.objects.create(
+                customer_name=f"c{i}",
+                customer_phone="1",
+                service=cls.service,
+                starts_at=work_start + timedelta(minutes=90 * i),
+                status=Booking.Status.COMPLETED,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_slots_queries_are_constant(self):
+        with self.assertNumQueries(3):
+            slots = get_available_slots(self.service, self.day)
+        self.assertTrue(slots)
+        # 10:00 занято бронью 10:00–10:30 и буфером до 10:40
+        self.assertNotIn(
+            timezone.make_aware(datetime.combine(self.day, WORK_START)),
+            [s["start"] for s in slots],
+        )
+
+    def test_days_queries_are_constant(self):
+        with self.assertNumQueries(3):
+            days = get_available_days(self.service, days_ahead=14)
+        self.assertIn(self.day, days)
+
+    def test_streaming_and_early_exit_agree_with_full_list(self):
+        slots = get_available_slots(self.service, self.day)
+        cache.clear()
+        self.assertEqual(list(islice(iter_available_slots(self.service, self.day), 3)), slots[:3])
+        self.assertTrue(has_free_slot(self.service, self.day))
+        sunday = self.day + timedelta(days=6 - self.day.weekday())
+        self.assertFalse(has_free_slot(self.service, sunday))
+        self.assertEqual(list(iter_available_slots(self.service, sunday)), [])
+
+    def test_month_page_matches_rolling_window(self):
+        today = timezone.localdate()
+        window = get_available_days(self.service, days_ahead=62)
+        page = get_available_month(self.service, today.year, today.month)
+        self.assertEqual(page.start, today.replace(day=1))
+        self.assertEqual(page.dates(), [d for d in window if d <= page.end])
+        self.assertEqual(page.iso_dates(), [d.isoformat() for d in page.dates()])
+
+    def test_page_length_is_bounded(self):
+        today = timezone.localdate()
+        with self.assertRaises(ValueError):
+            get_available_days_page(self.service, today, today + timedelta(days=400))
+
+    def test_bulk_reads_schedule_once_for_all_services(self):
+        long_service = Service.objects.create(
+            category=self.service.category, name="Color", price=300, duration_min=240
+        )
+        services = [self.service, long_service]
+
+        with self.assertNumQueries(3):
+            days = get_available_days_bulk(services, days_ahead=14)
+        # индекс выходных уже построен первым вызовом
+        with self.assertNumQueries(2):
+            slots = get_available_slots_bulk(services, self.day)
+
+        cache.clear()
+        for service in services:
+            self.assertEqual(days[service.pk], get_available_days(service, days_ahead=14))
+            self.assertEqual(slots[service.pk], get_available_slots(service, self.day))
+        self.assertLess(len(slots[long_service.pk]), len(slots[self.service.pk]))
+
+
+class AvailabilityCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = _make_service(60, buffer_after_min=0)
+        cls.day = _next_workday()
+        cls.other_day = _next_workday(1, after=cls.day)
+
+    def setUp(self):
+        cache.clear()
+
+    def _book(self, day, hour):
+        return Booking.objects.create(
+            customer_name="c",
+            customer_phone="1",
+            service=self.service,
+            starts_at=timezone.make_aware(datetime.combine(day, time(hour, 0))),
+            status=Booking.Status.COMPLETED,
+        )
+
+    def test_repeated_calls_hit_cache(self):
+        get_available_slots(self.service, self.day)
+        get_available_days(self.service, days_ahead=10)
+        with self.assertNumQueries(0):
+            get_available_slots(self.service, self.day)
+            get_available_days(self.service, days_ahead=10)
+
+    def test_booking_invalidates_only_its_date(self):
+        before = get_available_slots(self.service, self.day)
+        get_available_slots(self.service, self.other_day)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._book(self.day, 10)
+
+        with self.assertNumQueries(0):
+            get_available_slots(self.service, self.other_day)
+        after = get_available_slots(self.service, self.day)
+        self.assertLess(len(after), len(before))
+
+    def test_moving_booking_invalidates_old_date(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = self._book(self.day, 10)
+        full = len(get_available_slots(self.service, self.other_day))
+        busy = len(get_available_slots(self.service, self.day))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.starts_at = timezone.make_aware(datetime.combine(self.other_day, time(10, 0)))
+            booking.ends_at = None
+            booking.save()
+
+        self.assertEqual(len(get_available_slots(self.service, self.day)), full)
+        self.assertEqual(len(get_available_slots(self.service, self.other_day)), busy)
+
+    def test_pending_hold_expires_by_lock_deadline(self):
+        hold = Booking.objects.create(
+            customer_name="c",
+            customer_phone="1",
+            service=self.service,
+            starts_at=timezone.make_aware(datetime.combine(self.day, time(10, 0))),
+        )
+        self.assertEqual(hold.lock_expires_at, hold.created_at + scheduler.LOCK_TIMEOUT)
+        full = len(get_available_slots(self.service, self.other_day))
+        self.assertLess(len(get_available_slots(self.service, self.day)), full)
+
+        # истёкшая блокировка слот не держит, хотя строка ещё в БД
+        Booking.objects.filter(pk=hold.pk).update(lock_expires_at=timezone.now())
+        cache.clear()
+        self.assertEqual(len(get_available_slots(self.service, self.day)), full)
+
+        hold.complete()
+        hold.refresh_from_db()
+        self.assertIsNone(hold.lock_expires_at)
+
+    def test_stale_lock_does_not_free_confirmed_booking(self):
+        booking = self._book(self.day, 10)
+        full = len(get_available_slots(self.service, self.other_day))
+        # подтверждение мимо save(): срок блокировки остался в строке
+        Booking.objects.filter(pk=booking.pk).update(
+            status=Booking.Status.CONFIRMED,
+            lock_expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        cache.clear()
+        self.assertLess(len(get_available_slots(self.service, self.day)), full)
+        self.assertIn(booking, Booking.objects.active())
+
+    def test_store_respects_lock_deadline(self):
+        _, keys = availability_cache.lookup_many("slots", [self.service], [self.day, self.other_day], 10)
+        availability_cache.store_many(
+            {self.service.pk: {self.day: [], self.other_day: []}},
+            keys,
+            {self.day: timezone.now() - timedelta(seconds=1), self.other_day: None},
+        )
+        self.assertIsNone(cache.get(keys[self.service.pk][self.day]))
+        self.assertEqual(cache.get(keys[self.service.pk][self.other_day]), [])
+
+    def test_deleted_service_invalidates_its_own_entries(self):
+        service = Service.objects.create(
+            category=self.service.category, name="Temp", price=1, duration_min=30
+        )
+        service_id = service.pk
+        with mock.patch("booking.services.availability_cache.invalidate_service") as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                service.delete()
+        invalidate.assert_called_once_with(service_id)
+
+    def test_service_change_invalidates_its_booked_dates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._book(self.day, 10)
+        other = Service.objects.create(
+            category=self.service.category, name="Short", price=1, duration_min=30
+        )
+        before = get_available_slots(other, self.day)
+        get_available_slots(other, self.other_day)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.buffer_after_min = 60
+            self.service.save()
+
+        with self.assertNumQueries(0):
+            get_available_slots(other, self.other_day)
+        self.assertLess(len(get_available_slots(other, self.day)), len(before))
+
+    def test_daysoff_invalidates_range(self):
+        self.assertIn(self.day, get_available_days(self.service, days_ahead=10))
+        with self.captureOnCommitCallbacks(execute=True):
+            DaysOff.objects.create(start=self.day, end=self.day)
+        self.assertNotIn(self.day, get_available_days(self.service, days_ahead=10))
+
+
+class AvailabilityEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = _make_service(60)
+        cls.day = _next_workday()
+
+    def setUp(self):
+        cache.clear()
+
+    def _slots_url(self):
+        return reverse("booking:available-slots", args=[self.service.pk]) + f"?date={self.day}"
+
+    def test_slots_conditional_get(self):
+        response = self.client.get(self._slots_url())
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        # пустой рабочий день: все начала сетки, при которых услуга укладывается до конца дня
+        work_minutes = (WORK_END.hour - WORK_START.hour) * 60 + WORK_END.minute - WORK_START.minute
+        expected = (work_minutes - self.service.duration_min) // scheduler.GRID_STEP + 1
+        self.assertEqual(len(response.json()["slots"]), expected)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self._slots_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                customer_name="c",
+                customer_phone="1",
+                service=self.service,
+                starts_at=timezone.make_aware(datetime.combine(self.day, time(12, 0))),
+                status=Booking.Status.COMPLETED,
+            )
+        response = self.client.get(self._slots_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_days_windows(self):
+        url = reverse("booking:available-days", args=[self.service.pk])
+        rolling = self.client.get(url, {"days_ahead": 14}).json()
+        self.assertIn(self.day.isoformat(), rolling["days"])
+        self.assertEqual(len(rolling["mask"]), 14)
+
+        page = self.client.get(url, {"start": self.day, "end": self.day}).json()
+        self.assertEqual(page["days"], [self.day.isoformat()])
+        self.assertEqual(page["mask"], "1")
+
+        month = self.client.get(url, {"year": self.day.year, "month": self.day.month}).json()
+        self.assertIn(self.day.isoformat(), month["days"])
+
+        self.assertEqual(self.client.get(url, {"days_ahead": 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"year": 2025, "month": 13}).status_code, 400)
+
+        for params in (
+            {"year": 9999, "month": 12},
+            {"start": "9999-12-31", "end": "9999-12-31"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        slots_url = reverse("booking:available-slots", args=[self.service.pk])
+        self.assertEqual(self.client.get(slots_url, {"date": "9999-12-31"}).status_code, 400)
+
+        response = self.client.get(url, {"year": 2025})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "missing parameter: month"})
+
+    def test_requests_do_not_grow_the_cache_without_bound(self):
+        days_url = reverse("booking:available-days", args=[self.service.pk])
+        yesterday = timezone.localdate() - timedelta(days=1)
+        for params in ({"year": 1, "month": 1}, {"start": yesterday, "end": yesterday}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(days_url, params).status_code, 400)
+        slots_url = reverse("booking:available-slots", args=[self.service.pk])
+        self.assertEqual(self.client.get(slots_url, {"date": yesterday}).status_code, 400)
+
+        missing_url = reverse("booking:available-slots", args=[0])
+        with mock.patch.object(cache, "add", wraps=cache.add) as add:
+            self.assertEqual(self.client.get(missing_url, {"date": self.day}).status_code, 404)
+        # версия услуги заводится только её изменением, версии дат — с конечным сроком
+        self.assertIsNone(cache.get(availability_cache._service_version_key(0)))
+        self.assertTrue(add.call_args_list)
+        for call in add.call_args_list:
+            self.assertEqual(call.kwargs["timeout"], availability_cache.VERSION_TTL)
+
+    async def test_async_views_match_sync(self):
+        for name, params in (
+            ("available-days", {"days_ahead": 14}),
+            ("available-days", {"start": self.day.isoformat(), "end": self.day.isoformat()}),
+            ("available-slots", {"date": self.day.isoformat()}),
+        ):
+            sync_response = await sync_to_async(self.client.get)(
+                reverse(f"booking:{name}", args=[self.service.pk]), params
+            )
+            await sync_to_async(cache.clear)()
+            async_response = await self.async_client.get(
+                reverse(f"booking:{name}-async", args=[self.service.pk]), params
+            )
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.json(), sync_response.json())
+            self.assertIn("ETag", async_response)
+
+        missing = await self.async_client.get(
+            reverse("booking:available-slots-async", args=[0]), {"date": self.day.isoformat()}
+        )
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_async_etag_is_computed_off_the_event_loop(self):
+        schedule_etag = availability_cache.schedule_etag
+        loops = []
+
+        def etag(*args, **kwargs):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return schedule_etag(*args, **kwargs)
+
+        url = reverse("booking:available-slots-async", args=[self.service.pk])
+        with mock.patch("booking.services.availability_cache.schedule_etag", side_effect=etag):
+            response = await self.async_client.get(url, {"date": self.day.isoformat()})
+            self.assertEqual(response.status_code, 200)
+            cached = await self.async_client.get(
+                url, {"date": self.day.isoformat()}, headers={"if-none-match": response["ETag"]}
+            )
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(loops, [None, None])
+
+
+@skipUnless(connection.vendor == "postgresql", "план запроса проверяется только на PostgreSQL")
+class ActiveBookingsIndexTests(TransactionTestCase):
+    """Выборка броней дня должна идти по частичному индексу активных броней."""
+
+    def setUp(self):
+        service = _make_service()
+        start = timezone.make_aware(datetime.combine(date(2025, 1, 1), WORK_START))
+        statuses = list(Booking.Status.values)
+        Booking.objects.bulk_create(
+            Booking(
+                customer_name="c",
+                customer_phone="1",
+                service=service,
+                starts_at=start + timedelta(days=i // 20, minutes=30 * (i % 20)),
+                ends_at=start + timedelta(days=i // 20, minutes=30 * (i % 20) + 30),
+                status=status,
+                lock_expires_at=start if status == Booking.Status.PENDING else None,
+            )
+            for i, status in ((i, statuses[i % len(statuses)]) for i in range(20000))
+        )
+        # VACUUM нельзя выполнить в транзакции, поэтому TransactionTestCase
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE booking_booking")
+
+    def test_day_query_uses_active_index(self):
+        day = date(2025, 6, 2)
+        now = timezone.now()
+        range_start, range_end = scheduler._day_bounds(day, day)
+        qs = Booking.objects.filter(starts_at__gte=range_start, starts_at__lt=range_end)
+        self.assertTrue(list(scheduler._busy_rows_query(qs, now)))
+
+        plan = scheduler._busy_rows_query(qs, now).explain()
+        self.assertIn("booking_active_starts_idx", plan)
+
+
+class ReserveSlotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = _make_service(60, buffer_after_min=10)
+        cls.day = _next_workday()
+        cls.work_start = timezone.make_aware(datetime.combine(cls.day, WORK_START))
+
+    def _reserve(self, start, **fields):
+        return reserve_slot(self.service, start, customer_name="c", customer_phone="1", **fields)
+
+    def test_reserves_free_slot(self):
+        booking = self._reserve(self.work_start)
+        self.assertEqual(booking.status, Booking.Status.PENDING)
+        self.assertEqual(booking.ends_at, self.work_start + timedelta(minutes=60))
+
+    def test_rejects_overlap_off_grid_and_past(self):
+        self._reserve(self.work_start)
+        with self.assertRaises(SlotUnavailable):
+            self._reserve(self.work_start + timedelta(minutes=30))
+        with self.assertRaises(SlotUnavailable):
+            self._reserve(self.work_start + timedelta(minutes=123))
+        with self.assertRaises(SlotUnavailable):
+            self._reserve(timezone.now() - timedelta(hours=1))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_expired_hold_is_replaced(self):
+        stale = self._reserve(self.work_start)
+        Booking.objects.filter(pk=stale.pk).update(
+            lock_expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        fresh = self._reserve(self.work_start)
+        self.assertEqual(list(Booking.objects.values_list("pk", flat=True)), [fresh.pk])
+
+
+@skipUnless(connection.vendor == "postgresql", "advisory-блокировки есть только в PostgreSQL")
+class ReserveSlotConcurrencyTests(TransactionTestCase):
+    """Одновременные резервы из разных потоков и соединений."""
+
+    def setUp(self):
+        self.service = _make_service(60, buffer_after_min=10)
+        self.day = _next_workday()
+        self.work_start = timezone.make_aware(datetime.combine(self.day, WORK_START))
+
+    def _in_thread(self, fn, *args):
+        def run():
+            try:
+                fn(*args)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_overlapping_reservations_never_both_succeed(self):
+        threads_count = 24
+        barrier = threading.Barrier(threads_count)
+        won, lost = [], []
+
+        def attempt(i):
+            barrier.wait()
+            try:
+                won.append(
+                    reserve_slot(
+                        self.service,
+                        self.work_start + timedelta(minutes=10 * (i % 12)),
+                        customer_name=f"c{i}",
+                        customer_phone="1",
+                    )
+                )
+            except SlotUnavailable:
+                lost.append(i)
+
+        threads = [self._in_thread(attempt, i) for i in range(threads_count)]
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(won)
+        self.assertEqual(len(won) + len(lost), threads_count)
+        self.assertEqual(Booking.objects.count(), len(won))
+
+        # каждая бронь должна быть свободной относительно всех, созданных раньше:
+        # буфер после брони занимает время только у неё самой, поэтому
+        # проверка несимметрична и идёт в порядке создания
+        buffer = timedelta(minutes=self.service.buffer_after_min)
+        earlier = []
+        for b in Booking.objects.order_by("pk"):
+            for e in earlier:
+                self.assertTrue(
+                    b.ends_at <= e.starts_at or b.starts_at >= e.ends_at + buffer,
+                    f"{b.starts_at:%H:%M} overlaps {e.starts_at:%H:%M}",
+                )
+            earlier.append(b)
+
+    def test_other_days_are_not_blocked(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_day():
+            with transaction.atomic():
+                _lock_day(self.day)
+                locked.set()
+                release.wait(10)
+
+        holder = self._in_thread(hold_day)
+        self.assertTrue(locked.wait(5))
+
+        other_day = _next_workday(1, after=self.day)
+        other_start = timezone.make_aware(datetime.combine(other_day, WORK_START))
+        other = self._in_thread(
+            lambda: reserve_slot(self.service, other_start, customer_name="a", customer_phone="1")
+        )
+        same = self._in_thread(
+            lambda: reserve_slot(
+                self.service, self.work_start, customer_name="b", customer_phone="1"
+            )
+        )
+        try:
+            other.join(5)
+            self.assertFalse(other.is_alive())
+            same.join(0.5)
+            self.assertTrue(same.is_alive())
+        finally:
+            release.set()
+            holder.join()
+            same.join()
+            other.join()
+
+        self.assertEqual(Booking.objects.count(), 2)
+
+
+class CleanOldPendingBookingsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = _make_service()
+        cls.day = _next_workday()
+        start = timezone.make_aware(datetime.combine(cls.day, WORK_START))
+        expired = timezone.now() - scheduler.LOCK_TIMEOUT - timedelta(minutes=1)
+
+        def booking(i, status, created_at):
+            return Booking.objects.create(
+                customer_name="c",
+                customer_phone="1",
+                service=cls.service,
+                starts_at=start + timedelta(minutes=30 * i),
+                status=status,
+                created_at=created_at,
+            )
+
+        cls.stale = [booking(i, Booking.Status.PENDING, expired) for i in range(5)]
+        cls.fresh = booking(5, Booking.Status.PENDING, timezone.now())
+        cls.confirmed = booking(6, Booking.Status.COMPLETED, expired)
+        OutboxEvent.objects.create(
+            event_type="client_notify", payload={}, booking_id=cls.stale[0].pk
+        )
+
+    def test_deletes_expired_holds_in_batches(self):
+        before = availability_cache.get_versions([self.day])[self.day]
+
+        # 3 пачки по 2 (последняя неполная): выборка и два DELETE на пачку
+        # плюс SAVEPOINT/RELEASE — внутри TestCase транзакция пачки вложенная
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(9 + 6):
+            result = clean_old_pending_bookings(batch_size=2)
+
+        self.assertEqual(result, "Deleted 5 old pending bookings")
+        self.assertEqual(
+            set(Booking.objects.values_list("pk", flat=True)),
+            {self.fresh.pk, self.confirmed.pk},
+        )
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertNotEqual(availability_cache.get_versions([self.day])[self.day], before)
+
+    def test_pending_without_lock_deadline_is_rejected(self):
+        # такую бронь очистка не нашла бы, а слот она держала бы вечно
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Booking.objects.filter(pk=self.confirmed.pk).update(status=Booking.Status.PENDING)
+
+
+class BookingOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = _make_service()
+
+    def _confirmed(self, starts_at):
+        return Booking.objects.create(
+            customer_name="c",
+            customer_phone="1",
+            service=self.service,
+            starts_at=starts_at,
+            status=Booking.Status.CONFIRMED,
+        )
+
+    @mock.patch("notifications.publisher.group")
+    def test_confirmed_booking_writes_once_and_publishes_one_group(self, group):
+        starts_at = timezone.make_aware(datetime.combine(_next_workday(), WORK_START))
+
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(2):
+            booking = self._confirmed(starts_at)
+        group.assert_not_called()  # до коммита брокер не трогаем
+
+        for callback in callbacks:
+            callback()
+        group.assert_called_once()
+        group.return_value.apply_async.assert_called_once_with()
+
+        events = {e.event_type: e for e in OutboxEvent.objects.filter(booking_id=booking.pk)}
+        self.assertEqual(set(events), {"master_notify", "client_notify", "client_reminder"})
+        self.assertEqual(events["client_reminder"].execute_at, starts_at - timedelta(hours=1))
+        self.assertEqual(events["client_reminder"].payload["reminder_offset_minutes"], 60)
+        self.assertEqual(
+            events["client_notify"].payload["starts_time"],
+            timezone.localtime(starts_at).strftime("%H:%M"),
+        )
+
+        tasks = group.call_args.args[0]
+        self.assertEqual(
+            [(t.task, t.args) for t in tasks],
+            [
+                ("notifications.tasks.send_outbox_event", (events["master_notify"].pk,)),
+                ("notifications.tasks.send_outbox_event", (events["client_notify"].pk,)),
+            ],
+        )
+
+    @override_settings(OUTBOX_RELAY=True)
+    def test_relay_mode_only_writes_rows(self):
+        starts_at = timezone.make_aware(datetime.combine(_next_workday(), WORK_START))
+        with self.captureOnCommitCallbacks() as callbacks:
+            booking = self._confirmed(starts_at)
+        self.assertEqual(OutboxEvent.objects.filter(booking_id=booking.pk).count(), 3)
+        self.assertEqual(len(callbacks), 1)  # только инвалидация кеша доступности
+
+    @mock.patch("notifications.publisher.group")
+    def test_todays_reminder_is_registered_in_the_same_group(self, group):
+        # полдень: напоминание за час до записи в 15:00 всегда сегодня
+        now = timezone.make_aware(datetime(2030, 6, 3, 12, 0))
+        starts_at = now + timedelta(hours=3)
+
+        with mock.patch("django.utils.timezone.now", return_value=now), \
+                self.captureOnCommitCallbacks(execute=True):
+            self._confirmed(starts_at)
+
+        tasks = group.call_args.args[0]
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual(tasks[2].task, "notifications.tasks.register_outbox_event")
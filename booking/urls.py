@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import views
+
+app_name = "booking"
+
+urlpatterns = [
+    path("services/<int:service_id>/days/", views.available_days, name="available-days"),
+    path("services/<int:service_id>/slots/", views.available_slots, name="available-slots"),
+    # те же ответы из async-представлений — для запуска под ASGI (app.asgi)
+    path("async/services/<int:service_id>/days/", views.available_days_async, name="available-days-async"),
+    path("async/services/<int:service_id>/slots/", views.available_slots_async, name="available-slots-async"),
+]
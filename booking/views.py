@@ -1,3 +1,232 @@
-from django.shortcuts import render
+import calendar
+from datetime import date, datetime, timedelta
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition, require_GET
+
+from booking.services import availability_cache
+from booking.services.scheduler import (
+    GRID_STEP,
+    MAX_PAGE_DAYS,
+    DaysPage,
+    aget_available_days,
+    aget_available_days_page,
+    aget_available_slots,
+    get_available_days,
+    get_available_days_page,
+    get_available_slots,
+)
+from services.models import Service
+
+
+MAX_DAYS_AHEAD = 366
+
+
+class _BadRequest(ValueError):
+    pass
+
+
+def _window(request: HttpRequest) -> Tuple[date, date, bool]:
+    """
+    Окно дат из параметров запроса: `year`+`month`, `start`+`end` или `days_ahead`
+    (по умолчанию 60 дней от сегодня). Третий элемент — окно скользящее (`days_ahead`).
+    """
+    params = request.GET
+    rolling = False
+    try:
+        if "year" in params or "month" in params:
+            year, month = int(params["year"]), int(params["month"])
+            start = date(year, month, 1)
+            end = start.replace(day=calendar.monthrange(year, month)[1])
+        elif "start" in params or "end" in params:
+            start = date.fromisoformat(params["start"])
+            end = date.fromisoformat(params["end"])
+            if end < start or (end - start).days >= MAX_PAGE_DAYS:
+                raise _BadRequest(f"window must be 1..{MAX_PAGE_DAYS} days")
+        else:
+            days_ahead = int(params.get("days_ahead", 60))
+            if not 1 <= days_ahead <= MAX_DAYS_AHEAD:
+                raise _BadRequest(f"days_ahead must be 1..{MAX_DAYS_AHEAD}")
+            start = timezone.localdate()
+            end = start + timedelta(days=days_ahead - 1)
+            rolling = True
+    except KeyError as exc:
+        raise _BadRequest(f"missing parameter: {exc.args[0]}") from exc
+    except (ValueError, OverflowError) as exc:
+        raise _BadRequest(str(exc)) from exc
+    _check_horizon(start, end)
+    return start, end, rolling
+
+
+def _slots_day(request: HttpRequest) -> date:
+    try:
+        day = date.fromisoformat(request.GET["date"])
+    except (KeyError, ValueError) as exc:
+        raise _BadRequest("date must be YYYY-MM-DD") from exc
+    _check_horizon(day, day)
+    return day
+
+
+def _check_horizon(start: date, end: date) -> None:
+    """
+    Окно должно задевать даты от сегодня до MAX_DAYS_AHEAD вперёд: прошлое не
+    бронируют, дальше не записывают, и на каждую дату кеш заводит свою версию —
+    произвольные даты плодили бы ключи. Заодно окно не упрётся в date.max.
+    """
+    today = timezone.localdate()
+    if end < today:
+        raise _BadRequest("dates must not be in the past")
+    if start > today + timedelta(days=MAX_DAYS_AHEAD):
+        raise _BadRequest(f"date must be within {MAX_DAYS_AHEAD} days from today")
+
+
+def _days_etag(request: HttpRequest, service_id: int) -> Optional[str]:
+    try:
+        start, end, _ = _window(request)
+    except _BadRequest:
+        return None
+    # сегодняшняя дата в теге: прошедшие дни выпадают из ответа
+    return availability_cache.schedule_etag(
+        service_id,
+        availability_cache.date_range(start, end),
+        GRID_STEP,
+        salt=f"days:{timezone.localdate().isoformat()}",
+    )
+
+
+def _slots_etag(request: HttpRequest, service_id: int) -> Optional[str]:
+    try:
+        day = _slots_day(request)
+    except _BadRequest:
+        return None
+    return availability_cache.schedule_etag(service_id, [day], GRID_STEP, salt="slots")
+
+
+def _acondition(etag_func: Callable[..., Optional[str]]):
+    """
+    `condition(etag_func=...)` для async-представлений. Django вызывает etag_func
+    синхронно, прямо в event loop, а ETag читает версии из кеша (Redis) — здесь
+    он считается в потоке, как и остальные обращения к кешу в async API.
+    """
+    aetag_func = sync_to_async(etag_func, thread_sensitive=False)
+
+    def decorator(view):
+        @wraps(view)
+        async def inner(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            etag = await aetag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ("GET", "HEAD"):
+                response.headers.setdefault("ETag", etag)
+            return response
+
+        return inner
+
+    return decorator
+
+
+@require_GET
+@condition(etag_func=_days_etag)
+def available_days(request: HttpRequest, service_id: int) -> JsonResponse:
+    """Доступные дни услуги. Повторный запрос с If-None-Match получает 304 без обращения к БД."""
+    try:
+        start, end, rolling = _window(request)
+    except _BadRequest as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    service = get_object_or_404(Service, pk=service_id)
+
+    if rolling:
+        available = get_available_days(service, days_ahead=(end - start).days + 1)
+        page = DaysPage.from_dates(start, end, available)
+    else:
+        page = get_available_days_page(service, start, end)
+
+    return _days_response(service, page)
+
+
+@require_GET
+@condition(etag_func=_slots_etag)
+def available_slots(request: HttpRequest, service_id: int) -> JsonResponse:
+    """Свободные слоты услуги на дату `?date=YYYY-MM-DD`."""
+    try:
+        day = _slots_day(request)
+    except _BadRequest as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    service = get_object_or_404(Service, pk=service_id)
+    return _slots_response(service, day, get_available_slots(service, day))
+
+
+@require_GET
+@_acondition(_days_etag)
+async def available_days_async(request: HttpRequest, service_id: int) -> JsonResponse:
+    """`available_days` для ASGI: ожидание БД не держит поток воркера."""
+    try:
+        start, end, rolling = _window(request)
+    except _BadRequest as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    service = await _aget_service(service_id)
+
+    if rolling:
+        available = await aget_available_days(service, days_ahead=(end - start).days + 1)
+        page = DaysPage.from_dates(start, end, available)
+    else:
+        page = await aget_available_days_page(service, start, end)
+
+    return _days_response(service, page)
+
+
+@require_GET
+@_acondition(_slots_etag)
+async def available_slots_async(request: HttpRequest, service_id: int) -> JsonResponse:
+    """`available_slots` для ASGI."""
+    try:
+        day = _slots_day(request)
+    except _BadRequest as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    service = await _aget_service(service_id)
+    return _slots_response(service, day, await aget_available_slots(service, day))
+
+
+async def _aget_service(service_id: int) -> Service:
+    try:
+        return await Service.objects.aget(pk=service_id)
+    except Service.DoesNotExist:
+        raise Http404("Service not found")
+
+
+def _days_response(service: Service, page: DaysPage) -> JsonResponse:
+    return JsonResponse(
+        {
+            "service": service.pk,
+            "start": page.start.isoformat(),
+            "end": page.end.isoformat(),
+            "days": page.iso_dates(),
+            "mask": page.bits(),
+        }
+    )
+
+
+def _slots_response(service: Service, day: date, slots: List[Dict[str, datetime]]) -> JsonResponse:
+    return JsonResponse(
+        {
+            "service": service.pk,
+            "date": day.isoformat(),
+            "slots": [
+                {"start": s["start"].isoformat(), "end": s["end"].isoformat()}
+                for s in slots
+            ],
+        }
+    )
@@ -0,0 +1,71 @@
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import outbox
+from .dispatcher import build_context
+from .models import OutboxEvent
+from .services.telegram_service import render_telegram_message, send_telegram_digest
+
+
+# Режим дайджеста (TELEGRAM_DIGEST_SECONDS > 0): события master_notify не шлются
+# по одному, а копятся в outbox и уходят мастеру одним сообщением на окно.
+
+DIGEST_BATCH_SIZE = 50  # событий в одной пачке дайджеста
+
+_SCHEDULED_KEY = "notifications:telegram-digest:scheduled"
+
+MASTER_NOTIFY = OutboxEvent.EventTypes.MASTER_NOTIFY
+
+
+def enabled() -> bool:
+    return settings.TELEGRAM_DIGEST_SECONDS > 0
+
+
+def claim_schedule() -> bool:
+    """
+    True — вызывающий должен запланировать сборку дайджеста через
+    TELEGRAM_DIGEST_SECONDS; на одно окно сборка планируется один раз.
+    """
+    return cache.add(_SCHEDULED_KEY, 1, timeout=settings.TELEGRAM_DIGEST_SECONDS)
+
+
+def is_due() -> bool:
+    """Самое старое ожидающее уведомление мастеру ждёт уже целое окно."""
+    window_start = timezone.now() - timedelta(seconds=settings.TELEGRAM_DIGEST_SECONDS)
+    return OutboxEvent.objects.filter(
+        processed=False,
+        event_type=MASTER_NOTIFY,
+        execute_at__lte=window_start,
+    ).exists()
+
+
+def flush(batch_size: int = DIGEST_BATCH_SIZE) -> int:
+    """Отправить все наступившие уведомления мастеру дайджестом. Вернуть их число."""
+    # новые события после этого момента запланируют следующую сборку
+    cache.delete(_SCHEDULED_KEY)
+
+    sent = 0
+    while True:
+        events, _ = outbox.claim_due(batch_size, event_types=[MASTER_NOTIFY])
+        if not events:
+            break
+
+        ids: List[int] = [e.id for e in events]
+        try:
+            send_telegram_digest([
+                render_telegram_message(e.payload.get("reason"), build_context(e.payload))
+                for e in events
+            ])
+        except Exception:
+            outbox.release(ids)
+            raise
+        outbox.ack(ids)
+        sent += len(ids)
+
+        if len(events) < batch_size:
+            break
+    return sent
@@ -1,49 +1,199 @@
-from typing import Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from django.conf import settings
+from django.utils import timezone
 
 from notifications.services.email_service import send_email_notification
 from notifications.services.telegram_service import send_telegram_message
 
 
+# Каналы доставки регистрируются в реестре вместе со своими ограничениями:
+# сколько отправок одновременно и сколько в секунду (на процесс воркера).
+# Тип события маршрутизируется в канал по таблице, без if/elif.
+
+Handler = Callable[[str, dict], None]  # (event_type, context)
+
+
+class DeadlineExceeded(Exception):
+    """Событие не отправлялось: срок (аренда outbox) истёк раньше, чем до него дошла очередь."""
+
+
+class _RateLimit:
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        # каждый вызов бронирует свой момент отправки, спит уже без блокировки
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class Channel:
+    __slots__ = ("name", "handler", "max_concurrency", "_slots", "_rate")
+
+    def __init__(self, name: str, handler: Handler, max_concurrency: int = 1, rate_per_second: float = 0.0):
+        self.name = name
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._rate = _RateLimit(rate_per_second)
+
+    def send(self, event_type: str, context: dict) -> None:
+        with self._slots:
+            self._rate.wait()
+            self.handler(event_type, context)
+
+
+_channels: Dict[str, Channel] = {}
+_routes: Dict[str, Channel] = {}  # event_type -> канал
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def register_channel(
+    name: str,
+    handler: Handler,
+    event_types: Iterable[str],
+    max_concurrency: int = 1,
+    rate_per_second: float = 0.0,  # 0 — без ограничения
+) -> Channel:
+    global _executor
+    channel = Channel(name, handler, max_concurrency, rate_per_second)
+    _channels[name] = channel
+    for event_type in event_types:
+        _routes[event_type] = channel
+    with _executor_lock:
+        # размер пула считается от каналов — пересоздадим при следующей отправке
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+    return channel
+
+
+def channel_for(event_type: str) -> Optional[Channel]:
+    return _routes.get(event_type)
+
+
 def _format_datetime(iso_str) -> Optional[str]:
+    # для событий, созданных до starts_time/ends_time в payload
     if not iso_str:
         return None
     dt = datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
     return dt.strftime("%H:%M")
 
-def send_event(event_type: str, payload: dict) -> None:
+def build_context(payload: dict) -> dict:
     context = payload.copy()
     context.update(
         {
-            "starts_at": _format_datetime(payload.get("starts_at")),
-            "ends_at": _format_datetime(payload.get("ends_at")),
+            "starts_at": payload.get("starts_time") or _format_datetime(payload.get("starts_at")),
+            "ends_at": payload.get("ends_time") or _format_datetime(payload.get("ends_at")),
         }
     )
-    if event_type == "master_notify":        
-        send_telegram_message(
-            template_base=context.get("reason"),
-            context=context,
-        )
-        
-    elif event_type == "client_notify":        
-        send_email_notification(
-            template_base=context.get("reason"),
-            context=context,
-            to_email=context.get("customer_email"),
-            language=context.get("language"),
-        )
-        
-    elif event_type == "client_reminder":        
-        send_email_notification(
-            template_base=context.get("reason"),
-            context=context,
-            to_email=context.get("customer_email"),
-            language=context.get("language"),
-            event_type=event_type,
-        )
-        
-    else:
+    return context
+
+
+def send_event(event_type: str, payload: dict) -> None:
+    channel = channel_for(event_type)
+    if channel is None:
         return
+    channel.send(event_type, build_context(payload))
+
+
+def send_events(
+    events: Sequence[Tuple[str, dict]],  # (event_type, payload)
+    deadline: Optional[datetime] = None,
+) -> List[Optional[Exception]]:
+    """
+    Отправить пачку событий: разные каналы — параллельно в пуле потоков,
+    внутри канала — не больше его max_concurrency одновременно.
+    Вернуть по событию: None — отправлено (или тип без канала), иначе ошибку;
+    DeadlineExceeded — событие не отправлялось, потому что наступил `deadline`.
+    """
+    results: List[Optional[Exception]] = [None] * len(events)
+    queues: Dict[str, Deque[int]] = {}
+    for i, (event_type, _) in enumerate(events):
+        channel = channel_for(event_type)
+        if channel is not None:
+            queues.setdefault(channel.name, deque()).append(i)
+
+    def drain(queue: Deque[int]) -> None:
+        while True:
+            try:
+                i = queue.popleft()
+            except IndexError:
+                return
+            if deadline is not None and timezone.now() >= deadline:
+                results[i] = DeadlineExceeded()
+                continue
+            try:
+                send_event(*events[i])
+            except Exception as exc:
+                results[i] = exc
+
+    executor = _get_executor()
+    wait([
+        executor.submit(drain, queue)
+        for name, queue in queues.items()
+        for _ in range(min(_channels[name].max_concurrency, len(queue)))
+    ])
+    return results
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, sum(c.max_concurrency for c in _channels.values())),
+                thread_name_prefix="notify",
+            )
+        return _executor
+
+
+def _send_telegram(event_type: str, context: dict) -> None:
+    send_telegram_message(
+        template_base=context.get("reason"),
+        context=context,
+    )
+
+
+def _send_email(event_type: str, context: dict) -> None:
+    send_email_notification(
+        template_base=context.get("reason"),
+        context=context,
+        to_email=context.get("customer_email"),
+        language=context.get("language"),
+        event_type=event_type,
+    )
+
 
+# одно Telegram-сообщение в секунду — лимит Telegram для одного чата
+register_channel(
+    "telegram",
+    _send_telegram,
+    event_types=["master_notify"],
+    max_concurrency=1,
+    rate_per_second=settings.TELEGRAM_RATE_PER_SECOND,
+)
+# SMTP-соединение одно на процесс, параллельно в него не пишут
+register_channel(
+    "email",
+    _send_email,
+    event_types=["client_notify", "client_reminder"],
+    max_concurrency=1,
+    rate_per_second=settings.EMAIL_RATE_PER_SECOND,
+)
@@ -0,0 +1,69 @@
+import time
+from typing import Callable
+
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.template.loader import render_to_string
+
+from notifications.dispatcher import build_context
+from notifications.services import renderer
+
+
+class Command(BaseCommand):
+    help = "Сравнить стоимость рендера одного уведомления: render_to_string и кеш шаблонов воркера."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=5000, help="уведомлений на режим")
+
+    def handle(self, *args, **options):
+        context = build_context({
+            "booking_id": 1,
+            "reason": "booking_confirmed",
+            "customer_name": "Bench",
+            "customer_email": "bench@example.com",
+            "service_name": "Маникюр",
+            "date": "2025-01-01",
+            "starts_at": "2025-01-01T10:00:00+00:00",
+            "ends_at": "2025-01-01T11:00:00+00:00",
+            "language": "no",
+        })
+        count = options["messages"]
+
+        def before():
+            # как было: три поиска шаблона и три контекста на уведомление
+            render_to_string("subject/booking_confirmed_subject.txt", context).strip()
+            render_to_string("email/booking_confirmed.html", context)
+            render_to_string("telegram/booking_confirmed.html", context).strip()
+
+        def after():
+            renderer.render_email("booking_confirmed", context, "no")
+            renderer.render_telegram("booking_confirmed", context, "no")
+
+        # холодный старт: первое уведомление процесса без прогрева компилирует шаблоны
+        self._reset()
+        cold = self._measure(after, 1)
+        self._reset()
+        started = time.perf_counter()
+        renderer.build_table()
+        warm_up = time.perf_counter() - started
+        self.stdout.write(
+            f"{'first message':>16}: {cold * 1e3:.2f} ms cold, "
+            f"{self._measure(after, 1) * 1e3:.2f} ms after build_table() ({warm_up * 1e3:.2f} ms at worker start)"
+        )
+
+        for name, render in (("render_to_string", before), ("renderer", after)):
+            render()  # первая компиляция не в счёт
+            per_message = self._measure(render, count)
+            self.stdout.write(f"{name:>16}: {per_message * 1e6:.1f} µs/message ({count} messages)")
+
+    def _measure(self, render: Callable[[], None], count: int) -> float:
+        started = time.perf_counter()
+        for _ in range(count):
+            render()
+        return (time.perf_counter() - started) / count
+
+    def _reset(self) -> None:
+        renderer.clear()
+        for loader in engines["django"].engine.template_loaders:
+            if hasattr(loader, "reset"):
+                loader.reset()
@@ -0,0 +1,44 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notifications.relay import relay_due_events
+
+
+class Command(BaseCommand):
+    help = "Отправлять наступившие события outbox опросом БД (вместо ETA-задач Celery)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.OUTBOX_RELAY_BATCH_SIZE)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.OUTBOX_RELAY_INTERVAL,
+            help="пауза между опросами, когда наступивших событий нет (сек)",
+        )
+        parser.add_argument("--once", action="store_true", help="разобрать очередь и выйти")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while not self._stopping:
+            close_old_connections()
+            stats = relay_due_events(batch_size=batch_size)
+            if stats.claimed or stats.sent:
+                self.stdout.write(f"[relay_outbox] sent={stats.sent} failed={stats.failed}")
+
+            # полная пачка — очередь, скорее всего, не пуста: сразу следующую
+            if stats.claimed < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+
+    def _stop(self, signum, frame):
+        # текущая пачка дорабатывает, новая не берётся
+        self._stopping = True
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_outboxevent_booking_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
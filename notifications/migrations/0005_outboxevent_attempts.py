@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_outboxevent_leased_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -20,6 +20,12 @@ class OutboxEvent(models.Model):
     
     booking_id = models.IntegerField(null=True, db_index=True)
     task_id = models.CharField(max_length=255, null=True, blank=True)
+    # до какого момента событие отправляет взявший его исполнитель; пусто — свободно
+    leased_until = models.DateTimeField(null=True, blank=True)
+    # неудачных попыток отправки relay; после OUTBOX_RELAY_MAX_ATTEMPTS событие
+    # закрывается (processed) с текстом ошибки в last_error
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
     
     class Meta:
         indexes = [
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+
+# Отправка события в три шага: claim (короткий UPDATE выдаёт аренду),
+# сетевой вызов вне транзакции, ack/release (ещё один короткий UPDATE).
+# Исполнитель, упавший посреди отправки, держит событие только до leased_until —
+# потом его забирает следующий.
+
+
+def _lease_free(now: datetime) -> Q:
+    return Q(leased_until__isnull=True) | Q(leased_until__lte=now)
+
+
+def _lease_until(now: datetime) -> datetime:
+    return now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+
+
+def claim(event_id: int) -> Optional[OutboxEvent]:
+    """Взять событие в аренду. None — оно уже обработано, удалено или занято другим."""
+    now = timezone.now()
+    leased_until = _lease_until(now)
+    claimed = (
+        OutboxEvent.objects.filter(_lease_free(now), id=event_id, processed=False)
+        .update(leased_until=leased_until)
+    )
+    if not claimed:
+        return None
+    return OutboxEvent.objects.filter(id=event_id).first()
+
+
+def claim_due(
+    batch_size: int,
+    event_types: Optional[Iterable[str]] = None,
+    exclude_types: Iterable[str] = (),
+) -> Tuple[List[OutboxEvent], datetime]:
+    """
+    Взять в аренду пачку наступивших свободных событий (при необходимости —
+    только нужных типов). Строки выбираются SELECT ... FOR UPDATE SKIP LOCKED,
+    так что параллельные relay-процессы получают непересекающиеся пачки.
+    Вернуть события и срок аренды.
+    """
+    now = timezone.now()
+    leased_until = _lease_until(now)
+    qs = OutboxEvent.objects.filter(_lease_free(now), processed=False, execute_at__lte=now)
+    if event_types is not None:
+        qs = qs.filter(event_type__in=list(event_types))
+    exclude_types = list(exclude_types)
+    if exclude_types:
+        qs = qs.exclude(event_type__in=exclude_types)
+
+    with transaction.atomic():
+        events = list(
+            qs.select_for_update(skip_locked=True)
+            .order_by("execute_at")[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(id__in=[e.id for e in events]).update(
+                leased_until=leased_until
+            )
+    return events, leased_until
+
+
+def ack(event_ids: Iterable[int]) -> None:
+    """Отметить отправленные события обработанными и снять аренду."""
+    ids = list(event_ids)
+    if ids:
+        OutboxEvent.objects.filter(id__in=ids).update(
+            processed=True, processed_at=timezone.now(), leased_until=None
+        )
+
+
+def release(event_ids: Iterable[int], retry_at: Optional[datetime] = None) -> None:
+    """Вернуть неотправленные события в очередь (при необходимости — отложив до `retry_at`)."""
+    ids = list(event_ids)
+    if not ids:
+        return
+    fields = {"leased_until": None}
+    if retry_at is not None:
+        fields["execute_at"] = retry_at
+    OutboxEvent.objects.filter(id__in=ids, processed=False).update(**fields)
+
+
+def fail(events: Iterable[OutboxEvent], errors: Dict[int, str]) -> List[int]:
+    """
+    Учесть неудачную попытку отправки: вернуть событие в очередь с отсрочкой
+    OUTBOX_RELAY_RETRY_DELAY * 2^(попытка - 1) или, после OUTBOX_RELAY_MAX_ATTEMPTS
+    попыток, снять с очереди — processed, текст ошибки в last_error. Событие,
+    которое не отправится никогда (неверный адрес, удалённый чат), так не
+    крутится в relay бесконечно. Вернуть id снятых событий.
+    """
+    now = timezone.now()
+    retry: Dict[int, List[int]] = {}
+    dead: List[OutboxEvent] = []
+    for event in events:
+        attempts = event.attempts + 1
+        if attempts >= settings.OUTBOX_RELAY_MAX_ATTEMPTS:
+            dead.append(event)
+        else:
+            retry.setdefault(attempts, []).append(event.id)
+
+    # одна попытка — одна отсрочка: UPDATE на каждое число попыток, не на событие
+    for attempts, ids in retry.items():
+        delay = timedelta(seconds=settings.OUTBOX_RELAY_RETRY_DELAY * 2 ** (attempts - 1))
+        OutboxEvent.objects.filter(id__in=ids, processed=False).update(
+            attempts=attempts, execute_at=now + delay, leased_until=None
+        )
+    for event in dead:
+        OutboxEvent.objects.filter(id=event.id, processed=False).update(
+            attempts=event.attempts + 1,
+            processed=True,
+            processed_at=now,
+            leased_until=None,
+            last_error=errors.get(event.id, ""),
+        )
+    return [event.id for event in dead]
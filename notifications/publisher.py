@@ -0,0 +1,28 @@
+from typing import List, Optional
+
+from celery import group
+from celery.canvas import Signature
+from django.db import transaction
+
+
+def publish(*signatures: Signature, using: Optional[str] = None) -> None:
+    """
+    Поставить задачи в очередь после коммита текущей транзакции.
+
+    Задачи одного вызова уходят брокеру одной группой, поэтому воркер никогда
+    не получает id строки, которую ещё не видно в БД. Колбэк регистрируется
+    обычным `transaction.on_commit`: при откате до savepoint'а Django сам
+    выбрасывает его вместе с данными.
+    Вне транзакции задачи отправляются сразу.
+    """
+    if not signatures:
+        return
+    batch = list(signatures)
+    transaction.on_commit(lambda: _send(batch), using=using)
+
+
+def _send(signatures: List[Signature]) -> None:
+    if len(signatures) == 1:
+        signatures[0].apply_async()
+    elif signatures:
+        group(signatures).apply_async()
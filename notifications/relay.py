@@ -0,0 +1,62 @@
+from typing import Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+
+from . import digest, outbox
+from .dispatcher import DeadlineExceeded, send_events
+from .models import OutboxEvent
+
+
+class RelayStats(NamedTuple):
+    claimed: int
+    sent: int
+    failed: int
+
+
+def relay_due_events(batch_size: Optional[int] = None) -> RelayStats:
+    """
+    Забрать пачку наступивших событий outbox, отправить и отметить одним UPDATE.
+
+    Пачка берётся в аренду короткой транзакцией (SELECT ... FOR UPDATE SKIP LOCKED
+    по индексу (processed, execute_at)), поэтому несколько relay-процессов делят
+    очередь без двойной отправки, а сетевые вызовы идут вне транзакции и не держат
+    ни блокировок, ни соединения в транзакции.
+    Событие с ошибкой отправки возвращается в очередь с растущей отсрочкой
+    (от OUTBOX_RELAY_RETRY_DELAY, вдвое на каждую попытку), чтобы не занимать
+    голову очереди, а после OUTBOX_RELAY_MAX_ATTEMPTS попыток снимается с неё. Если аренда
+    подходит к концу, оставшиеся события пачки возвращаются без отправки.
+    """
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+    # в режиме дайджеста уведомления мастеру собирает digest.flush
+    exclude = [digest.MASTER_NOTIFY] if digest.enabled() else []
+    events, leased_until = outbox.claim_due(batch_size, exclude_types=exclude)
+
+    sent: List[int] = []
+    failed: List[OutboxEvent] = []
+    errors: Dict[int, str] = {}
+    skipped: List[int] = []
+    # каналы (почта, Telegram) отправляются параллельно, каждый в своих лимитах
+    results = send_events([(e.event_type, e.payload) for e in events], deadline=leased_until)
+    for event, error in zip(events, results):
+        if error is None:
+            sent.append(event.id)
+        elif isinstance(error, DeadlineExceeded):
+            skipped.append(event.id)
+        else:
+            print(f"[relay_outbox] event {event.id} ({event.event_type}) failed: {error!r}")
+            failed.append(event)
+            errors[event.id] = repr(error)
+
+    outbox.ack(sent)
+    for event_id in outbox.fail(failed, errors):
+        print(f"[relay_outbox] event {event_id} dropped after {settings.OUTBOX_RELAY_MAX_ATTEMPTS} attempts")
+    outbox.release(skipped)
+
+    digest_sent = 0
+    if exclude and digest.is_due():
+        try:
+            digest_sent = digest.flush()
+        except Exception as exc:
+            print(f"[relay_outbox] master digest failed: {exc!r}")
+
+    return RelayStats(claimed=len(events), sent=len(sent) + digest_sent, failed=len(failed))
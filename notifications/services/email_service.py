@@ -1,24 +1,32 @@
-from typing import Optional
+import threading
+import time
+from smtplib import SMTPServerDisconnected
+from typing import List, Optional
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection
 
+from .renderer import CLIENT_NOTIFY, render_email
 
-def send_email_notification(
+
+# после такого простоя соединение проверяется NOOP перед отправкой
+HEALTHCHECK_AFTER: float = 30.0  # сек
+
+# одно SMTP-соединение на процесс воркера: TLS и логин — один раз, а не на каждое письмо
+_connection = None
+_last_used: float = 0.0
+_lock = threading.Lock()
+
+
+def build_email_notification(
     template_base: str, # шаблон эмейла без расширения
     context: dict,
     to_email: str,
     language: Optional[str] = None,
     event_type: Optional[str] = None,
-) -> None:
-    if event_type == "client_reminder":
-        subject = render_to_string(f"subject/client_reminder_subject.txt", context).strip()
-        html_body = render_to_string(f"email/client_reminder.html", context)
-    else:
-        subject = render_to_string(f"subject/{template_base}_subject.txt", context).strip()
-        html_body = render_to_string(f"email/{template_base}.html", context)
-  
+) -> EmailMultiAlternatives:
+    subject, html_body = render_email(template_base, context, language, event_type or CLIENT_NOTIFY)
+
     msg = EmailMultiAlternatives(
         subject=subject,
         body="Это письмо в HTML формате. Пожалуйста, включите HTML для корректного отображения.",
@@ -26,5 +34,91 @@ def send_email_notification(
         to=[to_email],
     )
     msg.attach_alternative(html_body, "text/html")
-    msg.send(fail_silently=False)
-    
\ No newline at end of file
+    return msg
+
+
+def send_email_notification(
+    template_base: str, # шаблон эмейла без расширения
+    context: dict,
+    to_email: str,
+    language: Optional[str] = None,
+    event_type: Optional[str] = None,
+) -> None:
+    send_email_batch([
+        build_email_notification(template_base, context, to_email, language, event_type)
+    ])
+
+
+def send_email_batch(messages: List[EmailMultiAlternatives]) -> int:
+    """
+    Отправить письма через общее соединение процесса и вернуть число отправленных.
+
+    Письма уходят по одному, но в одной SMTP-сессии. Если сервер закрыл
+    соединение, оно переоткрывается и письмо отправляется ещё раз; при любой
+    другой ошибке соединение закрывается (следующая отправка откроет новое),
+    а ошибка пробрасывается — ретраи остаются на Celery.
+    """
+    sent = 0
+    with _lock:
+        connection = _acquire()
+        for msg in messages:
+            try:
+                try:
+                    sent += connection.send_messages([msg])
+                except SMTPServerDisconnected:
+                    _reconnect(connection)
+                    sent += connection.send_messages([msg])
+            except Exception:
+                _discard()
+                raise
+        _touch()
+    return sent
+
+
+def close_connection() -> None:
+    """Закрыть соединение процесса (при остановке воркера)."""
+    with _lock:
+        _discard()
+
+
+def _acquire():
+    global _connection
+    if _connection is None:
+        _connection = get_connection(fail_silently=False)
+        _connection.open()
+    elif time.monotonic() - _last_used > HEALTHCHECK_AFTER and not _is_alive(_connection):
+        _reconnect(_connection)
+    return _connection
+
+
+def _is_alive(connection) -> bool:
+    smtp = getattr(connection, "connection", None)
+    if smtp is None:
+        # не SMTP-бэкенд (консоль, locmem) — проверять нечего
+        return not hasattr(connection, "connection")
+    try:
+        return smtp.noop()[0] == 250
+    except (SMTPServerDisconnected, OSError):
+        return False
+
+
+def _reconnect(connection) -> None:
+    try:
+        connection.close()
+    finally:
+        connection.open()
+
+
+def _touch() -> None:
+    global _last_used
+    _last_used = time.monotonic()
+
+
+def _discard() -> None:
+    global _connection
+    connection, _connection = _connection, None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,145 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.template import Context, TemplateDoesNotExist, engines
+from django.template.base import Template
+
+
+# Скомпилированные шаблоны уведомлений на процесс воркера.
+# При старте воркера собирается таблица (event_type, reason, language) ->
+# шаблоны с уже разрешённой цепочкой языков; на горячем пути отправки —
+# только обращение к словарю, без поиска по загрузчикам и файловой системе.
+# Тема и тело письма рендерятся с одним контекстом.
+
+EMAIL = "email"
+TELEGRAM = "telegram"
+
+# канал -> шаблоны, которые рендерятся вместе (тема письма первой);
+# {lang} — подпапка языка ("en/") или пусто для шаблона по умолчанию
+_PATHS: Dict[str, Tuple[str, ...]] = {
+    EMAIL: ("subject/{lang}{base}_subject.txt", "email/{lang}{base}.html"),
+    TELEGRAM: ("telegram/{lang}{base}.html",),
+}
+
+MASTER_NOTIFY = "master_notify"
+CLIENT_NOTIFY = "client_notify"
+CLIENT_REMINDER = "client_reminder"
+
+# тип события -> канал и шаблон, если он не зависит от reason
+EVENTS: Dict[str, Tuple[str, Optional[str]]] = {
+    MASTER_NOTIFY: (TELEGRAM, None),
+    CLIENT_NOTIFY: (EMAIL, None),
+    CLIENT_REMINDER: (EMAIL, "client_reminder"),
+}
+KNOWN_REASONS: Tuple[str, ...] = ("booking_confirmed", "booking_canceled")
+
+_Key = Tuple[str, str, str]
+_table: Dict[_Key, Tuple[Template, ...]] = {}
+_lock = threading.Lock()
+
+
+def language_chain(language: Optional[str]) -> List[str]:
+    """
+    Языки в порядке поиска шаблона: сам язык, его основа ("en-us" -> "en"),
+    запасные из NOTIFICATION_LANGUAGE_FALLBACKS; последним — "" (шаблон без языка).
+    """
+    code = _normalize(language)
+    chain: List[str] = []
+    pending = [code, code.split("-")[0]] if code else []
+    while pending:
+        candidate = pending.pop(0)
+        if candidate and candidate not in chain:
+            chain.append(candidate)
+            pending.extend(settings.NOTIFICATION_LANGUAGE_FALLBACKS.get(candidate, ()))
+    chain.append("")
+    return chain
+
+
+def get_templates(
+    event_type: str,
+    reason: Optional[str],
+    language: Optional[str] = None,
+) -> Tuple[Template, ...]:
+    key = (event_type, reason or "", _normalize(language))
+    compiled = _table.get(key)
+    if compiled is None:
+        # язык или reason, которых не было при старте: разрешаем один раз
+        channel, template_base = EVENTS[event_type]
+        compiled = _resolve(channel, template_base or reason, key[2])
+        with _lock:
+            compiled = _table.setdefault(key, compiled)
+    return compiled
+
+
+def render(
+    event_type: str,
+    reason: Optional[str],
+    context: dict,
+    language: Optional[str] = None,
+) -> List[str]:
+    """Отрендерить все шаблоны события с одним контекстом; результат — в порядке _PATHS."""
+    ctx = Context(context, autoescape=engines["django"].engine.autoescape)
+    return [template.render(ctx) for template in get_templates(event_type, reason, language)]
+
+
+def render_email(
+    template_base: str,  # reason события
+    context: dict,
+    language: Optional[str] = None,
+    event_type: str = CLIENT_NOTIFY,
+) -> Tuple[str, str]:
+    """Тема (без пробелов по краям) и HTML-тело письма."""
+    subject, html_body = render(event_type, template_base, context, language)
+    return subject.strip(), html_body
+
+
+def render_telegram(
+    template_base: str,  # reason события
+    context: dict,
+    language: Optional[str] = None,
+    event_type: str = MASTER_NOTIFY,
+) -> str:
+    (text,) = render(event_type, template_base, context, language)
+    return text.strip()
+
+
+def build_table(languages: Optional[Iterable[str]] = None) -> int:
+    """
+    Разрешить и скомпилировать шаблоны всех известных событий для языков
+    NOTIFICATION_LANGUAGES (и уведомлений без языка). Вернуть размер таблицы.
+    """
+    languages = settings.NOTIFICATION_LANGUAGES if languages is None else languages
+    for language in ["", *languages]:
+        for event_type in EVENTS:
+            for reason in KNOWN_REASONS:
+                get_templates(event_type, reason, language)
+    return len(_table)
+
+
+def clear() -> None:
+    with _lock:
+        _table.clear()
+
+
+def _normalize(language: Optional[str]) -> str:
+    return (language or "").strip().lower().replace("_", "-")
+
+
+def _resolve(channel: str, template_base: str, language: str) -> Tuple[Template, ...]:
+    # тема и тело всегда на одном языке: берём первый язык, где есть все шаблоны канала
+    *languages, default = language_chain(language)
+    for candidate in languages:
+        try:
+            return _load(channel, template_base, f"{candidate}/")
+        except TemplateDoesNotExist:
+            continue
+    return _load(channel, template_base, default)
+
+
+def _load(channel: str, template_base: str, lang: str) -> Tuple[Template, ...]:
+    engine = engines["django"]
+    return tuple(
+        engine.get_template(path.format(lang=lang, base=template_base)).template
+        for path in _PATHS[channel]
+    )
@@ -1,40 +1,128 @@
+import threading
+import time
+from typing import List, Optional
+
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from django.conf import settings
-from django.template.loader import render_to_string
+
+from .renderer import render_telegram
+
+
+POOL_SIZE = 10           # соединений к API на процесс (потоки воркера)
+MAX_INLINE_WAIT = 5      # сек: 429 с retry_after дольше этого не ждём, отдаём ретраю Celery
+MESSAGE_LIMIT = 4096     # максимальная длина сообщения Telegram
 
 
 class TelegramServiceError(RuntimeError):
     pass
 
 
+class TelegramRateLimited(TelegramServiceError):
+    """Telegram ответил 429; `retry_after` — сколько секунд он просит подождать."""
+
+    def __init__(self, retry_after: int, message: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# одна keep-alive сессия на процесс: TCP+TLS к api.telegram.org не на каждое сообщение
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # повторяем только то, что точно не дошло до Telegram:
+                # ошибки соединения и 5xx; read=0 — ответ потерян, сообщение могло уйти
+                retry = Retry(
+                    total=3,
+                    connect=3,
+                    read=0,
+                    status=2,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset({"POST"}),
+                    backoff_factor=0.5,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def render_telegram_message(
+    template_base: str,  # шаблон сообщения без расширения
+    context: dict,
+) -> str:
+    return render_telegram(template_base, context)
+
+
 def send_telegram_message(
     template_base: str,  # шаблон сообщения без расширения
     context: dict,
 ) -> None:
-    
+    send_telegram_text(render_telegram_message(template_base, context))
+
+
+def send_telegram_digest(texts: List[str], separator: str = "\n\n") -> int:
+    """
+    Отправить несколько уведомлений минимальным числом сообщений (с учётом
+    лимита длины Telegram). Вернуть число отправленных сообщений.
+    """
+    chunks: List[str] = []
+    for text in texts:
+        if chunks and len(chunks[-1]) + len(separator) + len(text) <= MESSAGE_LIMIT:
+            chunks[-1] += separator + text
+        else:
+            chunks.append(text)
+    for chunk in chunks:
+        send_telegram_text(chunk)
+    return len(chunks)
+
+
+def send_telegram_text(text: str) -> None:
     bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
-    chat_id = getattr(settings, "TELEGRAM_CHAT_ID", None)   
+    chat_id = getattr(settings, "TELEGRAM_CHAT_ID", None)
     if not bot_token or not chat_id:
         raise TelegramServiceError("Telegram bot token or chat ID is not configured.")
-    
-    text = render_to_string(f"telegram/{template_base}.html", context).strip()
-
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
 
+    url = f"{settings.TELEGRAM_API_URL.rstrip('/')}/bot{bot_token}/sendMessage"
+    payload = {
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": "HTML",
+        "disable_web_page_preview": True,
+    }
 
-    resp = requests.post(
-        url,
-        json={
-            "chat_id": chat_id,
-            "text": text,
-            "parse_mode": "HTML",
-            "disable_web_page_preview": True,
-        },
-        timeout=10,
-    )
+    for attempt in range(2):
+        resp = get_session().post(url, json=payload, timeout=10)
+        if resp.status_code != 429:
+            break
+        # флуд-контроль: короткую паузу выжидаем здесь, длинную — ретраем задачи
+        retry_after = _retry_after(resp)
+        if attempt or retry_after > MAX_INLINE_WAIT:
+            raise TelegramRateLimited(retry_after, f"Telegram API rate limit: retry after {retry_after}s")
+        time.sleep(retry_after)
 
     if not resp.ok:
         raise TelegramServiceError(f"Telegram API error {resp.status_code}: {resp.text}")
-    # если ответ не 2xx — поднимаем исключение (Celery сможет ретраить)
\ No newline at end of file
+    # если ответ не 2xx — поднимаем исключение (Celery сможет ретраить)
+
+
+def _retry_after(resp: requests.Response) -> int:
+    try:
+        return int(resp.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return int(resp.headers.get("Retry-After", 1))
+    except ValueError:
+        return 1
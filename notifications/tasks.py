@@ -1,39 +1,78 @@
+from time import monotonic
+from typing import List, Optional, Tuple
+from uuid import uuid4
+
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from datetime import timedelta
+from django.db.models import Q
+from datetime import datetime, time, timedelta
 
 from .models import OutboxEvent
 from .dispatcher import send_event
+from . import digest, outbox, publisher
 
 # для ретраев по сетевым/SMTP-ошибкам
 import socket
 from smtplib import SMTPException
 from requests.exceptions import RequestException
 from django.core.exceptions import ObjectDoesNotExist
-from .services.telegram_service import TelegramServiceError
+from .services.telegram_service import TelegramRateLimited, TelegramServiceError
 
 
 @shared_task(
     autoretry_for=(RequestException, SMTPException, socket.timeout, TimeoutError, RuntimeError, TelegramServiceError),
     retry_backoff=True,          # экспоненциально: 1s, 2s, 4s, ...
     retry_jitter=True,           # немного рандома к бэкоффу
-    retry_kwargs={"max_retries": 5},
+    # ретрай с отсрочкой ждёт в notify-scheduled и не занимает воркер живых уведомлений
+    retry_kwargs={"max_retries": 5, "queue": settings.QUEUE_NOTIFY_SCHEDULED},
+    # подтверждение после отправки: задачу упавшего воркера получит другой,
+    # а повтор уже отправленного события отсечёт claim
+    acks_late=True,
+    bind=True,
 )
-def send_outbox_event(outbox_id: int):
-    with transaction.atomic():
-        event = OutboxEvent.objects.select_for_update().get(id=outbox_id)
-        if event.processed:
-            return
+def send_outbox_event(self, outbox_id: int):
+    # claim → отправка вне транзакции → ack: строка не заблокирована на время SMTP/Telegram
+    event = outbox.claim(outbox_id)
+    if event is None:
+        if OutboxEvent.objects.filter(id=outbox_id, processed=False).exists():
+            # событие отправляет другой исполнитель; если он упадёт, аренда истечёт
+            raise self.retry(countdown=settings.OUTBOX_LEASE_SECONDS, queue=settings.QUEUE_NOTIFY_SCHEDULED)
+        return  # уже отправлено или удалено
+
+    if event.event_type == OutboxEvent.EventTypes.MASTER_NOTIFY and digest.enabled():
+        # уйдёт в дайджесте вместе с соседними уведомлениями мастеру
+        outbox.release([event.id])
+        if digest.claim_schedule():
+            publisher.publish(flush_master_digest.signature(countdown=settings.TELEGRAM_DIGEST_SECONDS))
+        return
 
+    try:
         send_event(event.event_type, event.payload)
+    except TelegramRateLimited as exc:
+        # Telegram сам сказал, когда можно снова — ждём ровно столько
+        outbox.release([event.id])
+        raise self.retry(exc=exc, countdown=exc.retry_after, queue=settings.QUEUE_NOTIFY_SCHEDULED)
+    except Exception:
+        outbox.release([event.id])
+        raise
+
+    outbox.ack([event.id])
+
 
-        event.processed = True
-        event.processed_at = timezone.now()
-        event.save(update_fields=["processed", "processed_at"])
+@shared_task(
+    autoretry_for=(RequestException, socket.timeout, TimeoutError, TelegramServiceError),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 5},
+    acks_late=True,
+)
+def flush_master_digest():
+    """Собрать накопившиеся уведомления мастеру в одно сообщение Telegram."""
+    return {"sent": digest.flush()}
     
 
-@shared_task
+@shared_task(acks_late=True)
 def register_outbox_event(outbox_id: int):
     """
     Регистрирует отправку OutboxEvent на точное время execute_at (ETA).
@@ -42,49 +81,115 @@ def register_outbox_event(outbox_id: int):
     event = OutboxEvent.objects.get(id=outbox_id)
     now = timezone.now()
     if event.execute_at and event.execute_at > now:
-        res = send_outbox_event.apply_async(args=[event.id], eta=event.execute_at)
-        event.task_id = res.id
+        # id задачи задаём сами: он сохраняется до публикации, чтобы отмена брони
+        # всегда нашла, что отзывать
+        task_id = str(uuid4())
+        event.task_id = task_id
         event.save(update_fields=["task_id"])
+        publisher.publish(
+            send_outbox_event.signature(
+                args=[event.id],
+                eta=event.execute_at,
+                task_id=task_id,
+                queue=settings.QUEUE_NOTIFY_SCHEDULED,
+            )
+        )
     else:
-        send_outbox_event.delay(event.id)
+        publisher.publish(send_outbox_event.s(event.id))
+
+
+SCHEDULE_PAGE_SIZE = 1000  # событий на страницу и на одну публикацию группой
 
 
 @shared_task(
+    bind=True,
     autoretry_for=(Exception,),  # на всякий случай: если что-то пошло не так во время планирования
     retry_backoff=True,
     retry_jitter=True,
     retry_kwargs={"max_retries": 3},
 )
-def schedule_outbox_event():
+def schedule_outbox_event(self, page_size: int = SCHEDULE_PAGE_SIZE):
     """
     Ночной планировщик (дергается Celery Beat).
     Находит все непросессенные события на СЕГОДНЯ и:
       - если время прошло — шлёт сразу,
       - если в будущем — регистрирует с ETA.
+
+    День задаётся диапазоном [00:00, 00:00 следующего дня) по самому execute_at,
+    чтобы работал индекс (processed, execute_at). События читаются страницами
+    по ключу (execute_at, id) — память не растёт с размером очереди, — и каждая
+    страница уходит брокеру одной группой.
     """
     today = timezone.localdate()
     now = timezone.now()
 
+    if settings.OUTBOX_RELAY:
+        # события отправляет relay_outbox, ETA-задачи не нужны
+        return {"today": str(today), "scheduled": 0, "sent_now": 0}
+
+    day_start = timezone.make_aware(datetime.combine(today, time.min))
+    day_end = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min))
     qs = OutboxEvent.objects.filter(
         processed=False,
-        execute_at__date=today,
-    )
+        execute_at__gte=day_start,
+        execute_at__lt=day_end,
+    ).order_by("execute_at", "id")
 
     scheduled = 0
     sent_now = 0
+    pages = 0
+    started = monotonic()
 
     # небольшой допуск назад на случай дрейфа часов/рестартов
     grace_past = now - timedelta(minutes=1)
 
-    for ev in qs.iterator():
-        if ev.execute_at <= grace_past:
-            send_outbox_event.delay(ev.id)
-            sent_now += 1
-        else:
-            send_outbox_event.apply_async(args=[ev.id], eta=ev.execute_at)
-            scheduled += 1
+    last: Optional[Tuple[datetime, int]] = None
+    while True:
+        page = qs
+        if last is not None:
+            last_at, last_id = last
+            page = page.filter(Q(execute_at__gt=last_at) | Q(execute_at=last_at, id__gt=last_id))
+        rows: List[Tuple[int, datetime]] = list(page.values_list("id", "execute_at")[:page_size])
+        if not rows:
+            break
+
+        tasks = []
+        for event_id, execute_at in rows:
+            if execute_at <= grace_past:
+                tasks.append(send_outbox_event.s(event_id))
+                sent_now += 1
+            else:
+                tasks.append(
+                    send_outbox_event.signature(
+                        args=[event_id], eta=execute_at, queue=settings.QUEUE_NOTIFY_SCHEDULED
+                    )
+                )
+                scheduled += 1
+        publisher.publish(*tasks)
+
+        pages += 1
+        last = rows[-1][1], rows[-1][0]
+        if not self.request.called_directly:
+            self.update_state(
+                state="PROGRESS",
+                meta={"pages": pages, "scheduled": scheduled, "sent_now": sent_now},
+            )
+
+        if len(rows) < page_size:
+            break
+
+    elapsed = monotonic() - started
 
     # лаконичный лог в воркере
-    print(f"[schedule_outbox_event] {today} scheduled={scheduled} sent_now={sent_now} total={scheduled + sent_now}")
+    print(
+        f"[schedule_outbox_event] {today} scheduled={scheduled} sent_now={sent_now} "
+        f"total={scheduled + sent_now} pages={pages} elapsed={elapsed:.2f}s"
+    )
 
-    return {"today": str(today), "scheduled": scheduled, "sent_now": sent_now}
\ No newline at end of file
+    return {
+        "today": str(today),
+        "scheduled": scheduled,
+        "sent_now": sent_now,
+        "pages": pages,
+        "elapsed": round(elapsed, 3),
+    }
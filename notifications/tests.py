@@ -1,3 +1,608 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from smtplib import SMTPDataError, SMTPServerDisconnected
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import call_command
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from celery.exceptions import Retry
+
+from app.celery import app as celery_app
+from notifications import digest, dispatcher, publisher
+from notifications.models import OutboxEvent
+from notifications.relay import relay_due_events
+from notifications.services import email_service, renderer, telegram_service
+from notifications.services.telegram_service import TelegramRateLimited
+from notifications.tasks import schedule_outbox_event, send_outbox_event
+
+
+class _Rollback(Exception):
+    pass
+
+
+@mock.patch("notifications.publisher.group")
+class PublisherTests(TestCase):
+    def test_defers_each_call_as_one_group_until_commit(self, group):
+        first, second, third = mock.Mock(), mock.Mock(), mock.Mock()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            publisher.publish(first, second)
+            publisher.publish(third)
+
+        group.assert_not_called()
+        self.assertEqual(len(callbacks), 2)
+
+        for callback in callbacks:
+            callback()
+        group.assert_called_once_with([first, second])
+        group.return_value.apply_async.assert_called_once_with()
+        third.apply_async.assert_called_once_with()
+
+    def test_savepoint_rollback_drops_only_its_tasks(self, group):
+        kept, dropped, late = mock.Mock(), mock.Mock(), mock.Mock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            publisher.publish(kept)
+            try:
+                with transaction.atomic():
+                    publisher.publish(dropped, mock.Mock())
+                    raise _Rollback
+            except _Rollback:
+                pass
+            publisher.publish(late)
+
+        group.assert_not_called()
+        dropped.apply_async.assert_not_called()
+        kept.apply_async.assert_called_once_with()
+        late.apply_async.assert_called_once_with()
+
+    def test_single_task_is_sent_without_group(self, group):
+        task = mock.Mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            publisher.publish(task)
+
+        group.assert_not_called()
+        task.apply_async.assert_called_once_with()
+
+
+class PublisherAutocommitTests(TransactionTestCase):
+    @mock.patch("notifications.publisher.group")
+    def test_sends_immediately_outside_transaction(self, group):
+        first, second = mock.Mock(), mock.Mock()
+        publisher.publish(first, second)
+        group.assert_called_once_with([first, second])
+
+
+@override_settings(OUTBOX_RELAY_RETRY_DELAY=60)
+class RelayTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.due = [
+            OutboxEvent.objects.create(
+                event_type="client_notify", payload={"n": i}, execute_at=now - timedelta(minutes=i)
+            )
+            for i in range(3)
+        ]
+        self.future = OutboxEvent.objects.create(
+            event_type="client_reminder", payload={}, execute_at=now + timedelta(hours=1)
+        )
+        self.done = OutboxEvent.objects.create(
+            event_type="client_notify", payload={}, execute_at=now, processed=True
+        )
+
+    @mock.patch("notifications.dispatcher.send_event")
+    def test_sends_due_events_and_marks_them_in_bulk(self, send_event):
+        # аренда: SAVEPOINT, SELECT ... FOR UPDATE, UPDATE, RELEASE; затем один UPDATE-ack
+        with self.assertNumQueries(5):
+            stats = relay_due_events(batch_size=10)
+
+        self.assertEqual((stats.claimed, stats.sent, stats.failed), (3, 3, 0))
+        self.assertEqual(send_event.call_count, 3)
+        self.assertEqual(
+            set(OutboxEvent.objects.filter(processed=False).values_list("pk", flat=True)),
+            {self.future.pk},
+        )
+
+    @mock.patch("notifications.dispatcher.send_event")
+    def test_failed_event_is_postponed(self, send_event):
+        send_event.side_effect = lambda event_type, payload: payload == {"n": 0} and 1 / 0
+
+        before = timezone.now()
+        stats = relay_due_events(batch_size=10)
+
+        self.assertEqual((stats.sent, stats.failed), (2, 1))
+        failed = OutboxEvent.objects.get(pk=self.due[0].pk)
+        self.assertFalse(failed.processed)
+        self.assertGreaterEqual(failed.execute_at, before + timedelta(seconds=60))
+
+    @mock.patch("notifications.dispatcher.send_event", side_effect=RuntimeError("chat not found"))
+    def test_retries_back_off_and_poison_event_is_dropped(self, send_event):
+        OutboxEvent.objects.exclude(pk=self.due[0].pk).delete()
+        event = self.due[0]
+
+        with override_settings(OUTBOX_RELAY_MAX_ATTEMPTS=3):
+            for attempt, delay in ((1, 60), (2, 120)):
+                before = timezone.now()
+                relay_due_events(batch_size=10)
+                event.refresh_from_db()
+                self.assertEqual(event.attempts, attempt)
+                self.assertFalse(event.processed)
+                self.assertGreaterEqual(event.execute_at, before + timedelta(seconds=delay))
+                self.assertLess(event.execute_at, before + timedelta(seconds=delay * 2))
+                OutboxEvent.objects.filter(pk=event.pk).update(execute_at=timezone.now())
+
+            relay_due_events(batch_size=10)
+
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 3)
+        self.assertTrue(event.processed)
+        self.assertIn("chat not found", event.last_error)
+        self.assertEqual(relay_due_events(batch_size=10).claimed, 0)
+
+    # между пачками команда закрывает устаревшие соединения — в тесте это соединение TestCase
+    @mock.patch("notifications.management.commands.relay_outbox.close_old_connections")
+    @mock.patch("notifications.dispatcher.send_event")
+    def test_command_drains_queue_in_batches(self, send_event, close_old_connections):
+        call_command("relay_outbox", "--once", "--batch-size=2", stdout=mock.Mock())
+        self.assertEqual(send_event.call_count, 3)
+        self.assertEqual(OutboxEvent.objects.filter(processed=False).count(), 1)
+
+    @mock.patch("notifications.dispatcher.send_event")
+    def test_crashed_lease_is_reclaimed(self, send_event):
+        OutboxEvent.objects.filter(pk=self.due[0].pk).update(
+            leased_until=timezone.now() - timedelta(seconds=1)
+        )
+        OutboxEvent.objects.filter(pk=self.due[1].pk).update(
+            leased_until=timezone.now() + timedelta(minutes=1)
+        )
+        stats = relay_due_events(batch_size=10)
+        self.assertEqual(stats.sent, 2)
+        self.assertFalse(OutboxEvent.objects.get(pk=self.due[1].pk).processed)
+
+
+class DispatcherTests(SimpleTestCase):
+    def _patch_handler(self, name, handler):
+        patcher = mock.patch.object(dispatcher._channels[name], "handler", handler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_channels_are_sent_in_parallel_within_their_caps(self):
+        barrier = threading.Barrier(2, timeout=5)
+        lock = threading.Lock()
+        running = {"email": 0}
+        peak = {"email": 0}
+        sent = []
+
+        def email(event_type, context):
+            with lock:
+                running["email"] += 1
+                peak["email"] = max(peak["email"], running["email"])
+            if context["n"] == 0:
+                barrier.wait()  # разорвётся, если Telegram не идёт параллельно
+            with lock:
+                running["email"] -= 1
+                sent.append(context["n"])
+
+        def telegram(event_type, context):
+            barrier.wait()
+            sent.append("tg")
+
+        self._patch_handler("email", email)
+        self._patch_handler("telegram", telegram)
+        results = dispatcher.send_events([
+            ("client_notify", {"n": 0}),
+            ("master_notify", {}),
+            ("client_reminder", {"n": 1}),
+            ("unknown", {}),
+        ])
+
+        self.assertEqual(results, [None] * 4)
+        self.assertCountEqual(sent, [0, 1, "tg"])
+        self.assertEqual(peak["email"], 1)  # одно SMTP-соединение — по одному письму
+
+    def test_errors_and_expired_deadline_are_reported_per_event(self):
+        email = mock.Mock(side_effect=RuntimeError("smtp down"))
+        self._patch_handler("email", email)
+
+        results = dispatcher.send_events([("client_notify", {})])
+        self.assertIsInstance(results[0], RuntimeError)
+
+        email.reset_mock()
+        results = dispatcher.send_events(
+            [("client_notify", {})], deadline=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertIsInstance(results[0], dispatcher.DeadlineExceeded)
+        email.assert_not_called()
+
+    @mock.patch("notifications.dispatcher.time.sleep")
+    def test_rate_limit_spaces_sends(self, sleep):
+        limit = dispatcher._RateLimit(per_second=10)
+        for _ in range(3):
+            limit.wait()
+        delays = [c.args[0] for c in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 0.1, delta=0.02)
+        self.assertAlmostEqual(delays[1], 0.2, delta=0.02)
+
+    def test_context_prefers_normalized_times(self):
+        context = dispatcher.build_context({
+            "starts_at": "2025-01-01T09:00:00+00:00",
+            "starts_time": "10:00",
+            "ends_at": "2025-01-01T10:00:00Z",
+        })
+        self.assertEqual(context["starts_at"], "10:00")
+        self.assertEqual(context["ends_at"], "10:00")  # старый payload: разбираем ISO
+
+
+class SendOutboxEventTests(TestCase):
+    def setUp(self):
+        self.event = OutboxEvent.objects.create(event_type="client_notify", payload={"a": 1})
+
+    @mock.patch("notifications.tasks.send_event")
+    def test_claims_sends_and_acks(self, send_event):
+        def check_lease(event_type, payload):
+            row = OutboxEvent.objects.get(pk=self.event.pk)
+            self.assertIsNotNone(row.leased_until)
+            self.assertFalse(row.processed)
+
+        send_event.side_effect = check_lease
+        send_outbox_event(self.event.pk)
+
+        send_event.assert_called_once_with("client_notify", {"a": 1})
+        self.event.refresh_from_db()
+        self.assertTrue(self.event.processed)
+        self.assertIsNone(self.event.leased_until)
+
+        send_outbox_event(self.event.pk)  # повтор — уже отправлено
+        send_event.assert_called_once()
+
+    @mock.patch("notifications.tasks.send_event", side_effect=RuntimeError("smtp down"))
+    def test_failed_send_releases_lease(self, send_event):
+        with self.assertRaises(RuntimeError):
+            send_outbox_event(self.event.pk)
+        self.event.refresh_from_db()
+        self.assertFalse(self.event.processed)
+        self.assertIsNone(self.event.leased_until)
+
+    @mock.patch("notifications.tasks.send_event")
+    def test_busy_lease_is_retried_later(self, send_event):
+        OutboxEvent.objects.filter(pk=self.event.pk).update(
+            leased_until=timezone.now() + timedelta(minutes=1)
+        )
+        with self.assertRaises(Retry):
+            send_outbox_event(self.event.pk)
+        send_event.assert_not_called()
+
+    @mock.patch("notifications.tasks.send_event", side_effect=TelegramRateLimited(30, "slow down"))
+    def test_rate_limited_retry_waits_in_scheduled_queue(self, send_event):
+        with mock.patch.object(send_outbox_event, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                send_outbox_event(self.event.pk)
+        self.assertEqual(retry.call_args.kwargs["countdown"], 30)
+        self.assertEqual(retry.call_args.kwargs["queue"], "notify-scheduled")
+        self.assertIsNone(OutboxEvent.objects.get(pk=self.event.pk).leased_until)
+
+    @mock.patch("notifications.tasks.send_event")
+    def test_missing_event_is_ignored(self, send_event):
+        send_outbox_event(0)
+        send_event.assert_not_called()
+
+
+class ScheduleOutboxEventTests(TestCase):
+    def setUp(self):
+        # полдень: прошлые и будущие события дня не зависят от того, когда идёт прогон
+        now = timezone.make_aware(datetime(2030, 6, 3, 12, 0))
+        patcher = mock.patch("django.utils.timezone.now", return_value=now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        day_start = timezone.make_aware(datetime.combine(now.date(), time.min))
+        day_end = day_start + timedelta(days=1)
+
+        def event(execute_at, **kwargs):
+            return OutboxEvent.objects.create(
+                event_type="client_reminder", payload={}, execute_at=execute_at, **kwargs
+            )
+
+        past = now - timedelta(minutes=5)
+        future = now + timedelta(minutes=5)
+        # одинаковый execute_at у нескольких событий: ключ страницы включает id
+        self.past = [event(past) for _ in range(3)]
+        self.future = [event(future) for _ in range(2)]
+        event(day_end)  # завтра
+        event(day_start - timedelta(seconds=1))  # вчера
+        event(past, processed=True)
+
+    @mock.patch("notifications.tasks.publisher.publish")
+    def test_pages_through_todays_events(self, publish):
+        # три страницы по 2 — три SELECT и три публикации
+        with self.assertNumQueries(3):
+            result = schedule_outbox_event(page_size=2)
+
+        self.assertEqual(publish.call_count, 3)
+        signatures = [sig for call in publish.call_args_list for sig in call.args]
+        self.assertEqual(
+            [sig.args[0] for sig in signatures],
+            [e.pk for e in self.past + self.future],
+        )
+        self.assertEqual(
+            [sig.options.get("eta") for sig in signatures],
+            [None] * 3 + [e.execute_at for e in self.future],
+        )
+        # ETA-задачи ждут в своей очереди, а не в очереди живых уведомлений
+        self.assertEqual(
+            [sig.options.get("queue") for sig in signatures],
+            [None] * 3 + ["notify-scheduled"] * 2,
+        )
+        self.assertEqual(
+            (result["sent_now"], result["scheduled"], result["pages"]), (3, 2, 3)
+        )
+
+
+class CeleryRoutingTests(SimpleTestCase):
+    def _queue(self, task_name):
+        return celery_app.amqp.router.route({}, task_name)["queue"].name
+
+    def test_tasks_are_split_by_queue(self):
+        self.assertEqual(self._queue("notifications.tasks.send_outbox_event"), "notify-realtime")
+        self.assertEqual(self._queue("notifications.tasks.register_outbox_event"), "notify-scheduled")
+        self.assertEqual(self._queue("notifications.tasks.schedule_outbox_event"), "maintenance")
+        self.assertEqual(self._queue("booking.tasks.clean_old_pending_bookings"), "maintenance")
+        self.assertTrue(send_outbox_event.acks_late)
+
+
+class _FakeSMTPBackend:
+    """SMTP-бэкенд без сети: считает открытия и умеет «терять» соединение."""
+
+    def __init__(self, failures=()):
+        self.connection = None
+        self.opened = 0
+        self.failures = list(failures)
+        self.sent = []
+
+    def open(self):
+        self.opened += 1
+        self.connection = mock.Mock(**{"noop.return_value": (250, b"OK")})
+
+    def close(self):
+        self.connection = None
+
+    def send_messages(self, messages):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.extend(messages)
+        return len(messages)
+
+
+class EmailConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        email_service.close_connection()
+        self.addCleanup(email_service.close_connection)
+
+    def _messages(self, count):
+        return [EmailMultiAlternatives(subject=f"s{i}", body="b", to=[f"{i}@example.com"]) for i in range(count)]
+
+    def test_batches_share_one_connection(self):
+        with mock.patch.object(email_service, "get_connection", wraps=email_service.get_connection) as get:
+            self.assertEqual(email_service.send_email_batch(self._messages(3)), 3)
+            self.assertEqual(email_service.send_email_batch(self._messages(2)), 2)
+        get.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_reconnects_when_server_drops_connection(self):
+        backend = _FakeSMTPBackend(failures=[SMTPServerDisconnected()])
+        with mock.patch.object(email_service, "get_connection", return_value=backend):
+            self.assertEqual(email_service.send_email_batch(self._messages(2)), 2)
+        self.assertEqual(backend.opened, 2)
+        self.assertEqual(len(backend.sent), 2)
+
+    @mock.patch.object(email_service, "HEALTHCHECK_AFTER", -1)
+    def test_idle_connection_is_health_checked(self):
+        backend = _FakeSMTPBackend()
+        with mock.patch.object(email_service, "get_connection", return_value=backend):
+            email_service.send_email_batch(self._messages(1))
+            backend.connection.noop.side_effect = SMTPServerDisconnected()
+            email_service.send_email_batch(self._messages(1))
+        self.assertEqual(backend.opened, 2)
+
+    def test_error_discards_connection(self):
+        broken = _FakeSMTPBackend(failures=[SMTPDataError(554, b"rejected")])
+        fresh = _FakeSMTPBackend()
+        with mock.patch.object(email_service, "get_connection", side_effect=[broken, fresh]):
+            with self.assertRaises(SMTPDataError):
+                email_service.send_email_batch(self._messages(1))
+            self.assertEqual(email_service.send_email_batch(self._messages(1)), 1)
+        self.assertIsNone(broken.connection)
+        self.assertEqual(len(fresh.sent), 1)
+
+
+class RendererTests(SimpleTestCase):
+    context = {
+        "customer_name": "Ola <b>",
+        "service_name": "Стрижка",
+        "date": "2025-01-01",
+        "starts_at": "10:00",
+        "ends_at": "11:00",
+    }
+
+    def setUp(self):
+        renderer.clear()
+        self.addCleanup(renderer.clear)
+
+    def test_matches_render_to_string(self):
+        subject, html_body = renderer.render_email("booking_confirmed", self.context, "no")
+        self.assertEqual(
+            subject, render_to_string("subject/booking_confirmed_subject.txt", self.context).strip()
+        )
+        self.assertEqual(html_body, render_to_string("email/booking_confirmed.html", self.context))
+        self.assertIn("Ola &lt;b&gt;", html_body)
+        self.assertEqual(
+            renderer.render_telegram("booking_confirmed", self.context),
+            render_to_string("telegram/booking_confirmed.html", self.context).strip(),
+        )
+
+    def test_table_is_built_once_and_skips_loader(self):
+        self.assertEqual(renderer.build_table(), 18)  # ("", no, en) x 3 события x 2 reason
+        with mock.patch("django.template.backends.django.DjangoTemplates.get_template") as get_template:
+            msg = email_service.build_email_notification(
+                "booking_canceled", self.context, "ola@example.com", language="en"
+            )
+            renderer.render_telegram("booking_canceled", self.context)
+        get_template.assert_not_called()
+        self.assertEqual(msg.subject, "Your booking is cancelled")
+
+    def test_language_fallback_chain(self):
+        english = "Your booking is confirmed"
+        default = render_to_string("subject/booking_confirmed_subject.txt").strip()
+        for language, subject in (
+            ("en", english),
+            ("en-US", english),
+            ("no", default),
+            ("nb", default),
+            (None, default),
+            ("xx", default),
+        ):
+            with self.subTest(language=language):
+                self.assertEqual(
+                    renderer.render_email("booking_confirmed", self.context, language)[0], subject
+                )
+        self.assertEqual(renderer.language_chain("nb"), ["nb", "no", ""])
+
+        renderer.clear()
+        with override_settings(NOTIFICATION_LANGUAGE_FALLBACKS={"no": ["en"]}):
+            self.assertEqual(renderer.render_email("booking_confirmed", self.context, "no")[0], english)
+
+    def test_reminder_uses_its_own_template_in_every_language(self):
+        subject, html_body = renderer.render_email(
+            "booking_confirmed", self.context, "en", event_type=renderer.CLIENT_REMINDER
+        )
+        self.assertEqual(subject, "Appointment reminder")
+        self.assertIn("is coming up soon", html_body)
+
+
+class _TelegramStub(BaseHTTPRequestHandler):
+    """Ответы по сценарию `server.script` (по умолчанию 200 ok), запросы — в `server.requests`."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, как у api.telegram.org
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.client_address, self.path, body))
+        status, reply = self.server.script.pop(0) if self.server.script else (200, {"ok": True})
+        data = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TelegramStubMixin:
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _TelegramStub)
+        self.server.requests, self.server.script = [], []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        # новая сессия на тест: пул не должен держать соединения к прошлому серверу
+        telegram_service._session = None
+        self.addCleanup(setattr, telegram_service, "_session", None)
+
+        overrides = override_settings(
+            TELEGRAM_API_URL=f"http://127.0.0.1:{self.server.server_port}",
+            TELEGRAM_BOT_TOKEN="token",
+            TELEGRAM_CHAT_ID="42",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+
+class TelegramSessionTests(TelegramStubMixin, SimpleTestCase):
+    def test_messages_reuse_one_connection(self):
+        for i in range(3):
+            telegram_service.send_telegram_text(f"m{i}")
+
+        self.assertEqual([body["text"] for _, _, body in self.server.requests], ["m0", "m1", "m2"])
+        self.assertEqual({path for _, path, _ in self.server.requests}, {"/bottoken/sendMessage"})
+        self.assertEqual(len({client for client, _, _ in self.server.requests}), 1)
+
+    @mock.patch("notifications.services.telegram_service.time.sleep")
+    def test_short_rate_limit_is_waited_out(self, sleep):
+        self.server.script = [(429, {"ok": False, "parameters": {"retry_after": 2}})]
+        telegram_service.send_telegram_text("hi")
+        sleep.assert_called_once_with(2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_long_rate_limit_is_left_to_celery(self):
+        self.server.script = [(429, {"ok": False, "parameters": {"retry_after": 30}})]
+        with self.assertRaises(telegram_service.TelegramRateLimited) as ctx:
+            telegram_service.send_telegram_text("hi")
+        self.assertEqual(ctx.exception.retry_after, 30)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_server_error_is_retried_by_adapter(self):
+        self.server.script = [(502, {"ok": False})]
+        telegram_service.send_telegram_text("hi")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_client_error_raises(self):
+        self.server.script = [(400, {"ok": False, "description": "bad"})]
+        with self.assertRaises(telegram_service.TelegramServiceError):
+            telegram_service.send_telegram_text("hi")
+        self.assertEqual(len(self.server.requests), 1)
+
+
+@override_settings(TELEGRAM_DIGEST_SECONDS=60)
+class TelegramDigestTests(TelegramStubMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.events = [
+            OutboxEvent.objects.create(
+                event_type="master_notify",
+                payload={
+                    "reason": "booking_confirmed",
+                    "customer_name": f"client {i}",
+                    "service_name": "Cut",
+                    "starts_at": "2025-01-01T10:00:00+00:00",
+                },
+            )
+            for i in range(3)
+        ]
+
+    @mock.patch("notifications.tasks.publisher.publish")
+    def test_master_events_wait_for_one_flush(self, publish):
+        for event in self.events:
+            send_outbox_event(event.pk)
+
+        self.assertEqual(self.server.requests, [])
+        publish.assert_called_once()
+        self.assertFalse(OutboxEvent.objects.filter(processed=True).exists())
+
+        self.assertEqual(digest.flush(), 3)
+        self.assertEqual(len(self.server.requests), 1)
+        text = self.server.requests[0][2]["text"]
+        for i in range(3):
+            self.assertIn(f"client {i}", text)
+        self.assertEqual(OutboxEvent.objects.filter(processed=True).count(), 3)
+
+    def test_failed_digest_returns_events_to_queue(self):
+        self.server.script = [(400, {"ok": False})]
+        with self.assertRaises(telegram_service.TelegramServiceError):
+            digest.flush()
+        self.assertFalse(
+            OutboxEvent.objects.filter(processed=True).exists()
+            or OutboxEvent.objects.filter(leased_until__isnull=False).exists()
+        )